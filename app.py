@@ -9,11 +9,38 @@ from ta.momentum import RSIIndicator
 from ta.trend import EMAIndicator, MACD
 from ta.volatility import AverageTrueRange, BollingerBands
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 import json
+import copy
+import re
+import ast
+import html
+import urllib.request
+import urllib.parse
+from collections import deque, OrderedDict
+import sqlite3
+import zlib
+import hashlib
+from contextlib import contextmanager
 import warnings
 from streamlit_option_menu import option_menu
 import math
 import textwrap
+import os
+import sys
+import time
+import threading
+import queue
+import io
+import tempfile
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.dataset as ds
+import pyarrow.compute as pc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 warnings.filterwarnings('ignore')
 
@@ -405,29 +432,689 @@ def init_session_state():
         st.session_state.filtered_results = []
     if 'selected_ticker_analysis' not in st.session_state:
         st.session_state.selected_ticker_analysis = None
+    if 'screener_intervalo' not in st.session_state:
+        st.session_state.screener_intervalo = None
+    if 'screener_simulador' not in st.session_state:
+        st.session_state.screener_simulador = None
+    if 'screener_regras' not in st.session_state:
+        st.session_state.screener_regras = None
+    if 'monitor_estados' not in st.session_state:
+        st.session_state.monitor_estados = {}
+    if 'monitor_mudancas' not in st.session_state:
+        st.session_state.monitor_mudancas = {}
+    if 'monitor_ultima' not in st.session_state:
+        st.session_state.monitor_ultima = 0.0
+    if 'dias_decisao' not in st.session_state:
+        st.session_state.dias_decisao = {}
+    if 'pagina_cards' not in st.session_state:
+        st.session_state.pagina_cards = 1
+    if 'scanner_setups' not in st.session_state:
+        st.session_state.scanner_setups = None
+    if 'motor_alertas' not in st.session_state:
+        st.session_state.motor_alertas = criar_motor_alertas()
 
-# Executar inicialização
-init_session_state()
+
+# **Métricas de Operação (formato Prometheus)**
+METRICAS_PORTA = os.environ.get('SCREENER_METRICS_PORT')
+METRICAS_ARQUIVO = os.environ.get('SCREENER_METRICS_TEXTFILE')
+SESSAO_TIMEOUT_SEG = 300
+
+BUCKETS_LATENCIA = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BUCKETS_DURACAO = (1, 5, 10, 30, 60, 120, 300, 600)
+BUCKETS_TICKERS = (1, 5, 10, 25, 50, 100, 250, 500)
+
+def classificar_mercado(ticker):
+    """Classifica o ticker pelo sufixo da bolsa (.SA, -USD, =F ou US)"""
+    ticker = ticker.upper()
+    if ticker.endswith('.SA'):
+        return 'SA'
+    if ticker.endswith('-USD'):
+        return 'USD'
+    if ticker.endswith('=F'):
+        return 'F'
+    return 'US'
+
+class MetricasPrometheus:
+    """Registro thread-safe de contadores, gauges e histogramas"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._tipos = {}
+        self._ajuda = {}
+        self._sessoes = {}
+
+    def _registrar(self, nome, tipo, ajuda):
+        if nome not in self._tipos:
+            self._tipos[nome] = tipo
+            self._ajuda[nome] = ajuda
+
+    def incrementar(self, nome, valor=1, ajuda='', **labels):
+        """Incrementa um contador"""
+        chave = (nome, tuple(sorted(labels.items())))
+        with self._lock:
+            self._registrar(nome, 'counter', ajuda)
+            self._series[chave] = self._series.get(chave, 0) + valor
+
+    def definir(self, nome, valor, ajuda='', **labels):
+        """Define o valor de um gauge"""
+        chave = (nome, tuple(sorted(labels.items())))
+        with self._lock:
+            self._registrar(nome, 'gauge', ajuda)
+            self._series[chave] = valor
+
+    def observar(self, nome, valor, buckets, ajuda='', **labels):
+        """Registra uma observação em um histograma"""
+        chave = (nome, tuple(sorted(labels.items())))
+        with self._lock:
+            self._registrar(nome, 'histogram', ajuda)
+            serie = self._series.setdefault(chave, {
+                'buckets': tuple(buckets),
+                'contagens': [0] * len(buckets),
+                'soma': 0.0,
+                'total': 0
+            })
+            for i, limite in enumerate(serie['buckets']):
+                if valor <= limite:
+                    serie['contagens'][i] += 1
+            serie['soma'] += valor
+            serie['total'] += 1
+
+    def registrar_sessao(self, sessao_id):
+        """Marca a sessão como ativa e atualiza o gauge de sessões"""
+        agora = time.time()
+        with self._lock:
+            self._sessoes[sessao_id] = agora
+            for sid, visto in list(self._sessoes.items()):
+                if agora - visto > SESSAO_TIMEOUT_SEG:
+                    del self._sessoes[sid]
+            ativas = len(self._sessoes)
+        self.definir('screener_active_sessions', ativas,
+                     ajuda='Sessões com atividade nos últimos 5 minutos')
+
+    @staticmethod
+    def _formatar_labels(labels, extra=None):
+        itens = list(labels) + (list(extra) if extra else [])
+        if not itens:
+            return ''
+        corpo = ','.join(
+            f'{k}="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+            for k, v in itens
+        )
+        return '{' + corpo + '}'
+
+    def exportar(self):
+        """Exporta todas as séries no formato texto do Prometheus"""
+        with self._lock:
+            series = sorted(self._series.items(), key=lambda item: item[0])
+            linhas = []
+            nome_atual = None
+            for (nome, labels), valor in series:
+                if nome != nome_atual:
+                    linhas.append(f"# HELP {nome} {self._ajuda[nome]}")
+                    linhas.append(f"# TYPE {nome} {self._tipos[nome]}")
+                    nome_atual = nome
+
+                if self._tipos[nome] == 'histogram':
+                    for limite, contagem in zip(valor['buckets'], valor['contagens']):
+                        linhas.append(f"{nome}_bucket{self._formatar_labels(labels, [('le', limite)])} {contagem}")
+                    linhas.append(f"{nome}_bucket{self._formatar_labels(labels, [('le', '+Inf')])} {valor['total']}")
+                    linhas.append(f"{nome}_sum{self._formatar_labels(labels)} {valor['soma']}")
+                    linhas.append(f"{nome}_count{self._formatar_labels(labels)} {valor['total']}")
+                else:
+                    linhas.append(f"{nome}{self._formatar_labels(labels)} {valor}")
+
+        return '\n'.join(linhas) + '\n'
+
+    def exportar_arquivo(self, caminho):
+        """Grava as métricas em arquivo (textfile collector) de forma atômica"""
+        # Temporário único: execuções simultâneas (sessões, thread da API) não disputam o mesmo arquivo
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=os.path.dirname(caminho) or '.',
+                                         prefix='.metricas.', suffix='.tmp', delete=False) as f:
+            f.write(self.exportar())
+        try:
+            os.replace(f.name, caminho)
+        except OSError:
+            os.remove(f.name)
+            raise
+
+def iniciar_servidor_metricas(metricas, porta):
+    """Expõe /metrics em um servidor HTTP local em thread separada"""
+
+    class _HandlerMetricas(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            corpo = metricas.exportar().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', int(porta)), _HandlerMetricas)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+@st.cache_resource(show_spinner=False)
+def obter_metricas():
+    """Instância única de métricas compartilhada por todas as sessões"""
+    metricas = MetricasPrometheus()
+    if METRICAS_PORTA:
+        try:
+            iniciar_servidor_metricas(metricas, METRICAS_PORTA)
+        except OSError:
+            pass
+    return metricas
+
+def obter_id_sessao():
+    """Retorna o id da sessão Streamlit atual (None fora do runtime)"""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
+
+metricas = obter_metricas()
+
+# **Calendário de pregões - validade do cache conforme o mercado do ticker**
+# mercado -> (fuso, dias da semana com abertura, abertura em minutos, duração em minutos)
+CALENDARIOS_MERCADO = {
+    'SA': ('America/Sao_Paulo', (0, 1, 2, 3, 4), 10 * 60, 8 * 60),   # pregão + after/leilão
+    'US': ('America/New_York', (0, 1, 2, 3, 4), 9 * 60 + 30, 390),
+    'F': ('America/New_York', (6, 0, 1, 2, 3), 18 * 60, 23 * 60),    # Globex: dom-qui 18h até 17h
+    'USD': None                                                       # cripto 24/7
+}
+TTL_MERCADO_ABERTO = 300
+TOLERANCIA_FECHAMENTO_MIN = 30  # ajustes da última barra logo após o fechamento
+
+def situacao_mercado(ticker, agora=None):
+    """Retorna (aberto, próxima abertura) para o mercado do ticker; feriados não são modelados"""
+    calendario = CALENDARIOS_MERCADO.get(classificar_mercado(ticker))
+    if calendario is None:
+        return True, None
+
+    fuso, dias, abertura, duracao = calendario
+    agora = (agora or datetime.now(ZoneInfo(fuso))).astimezone(ZoneInfo(fuso))
+    hoje = agora.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    proxima = None
+    for deslocamento in range(-1, 8):
+        dia = hoje + timedelta(days=deslocamento)
+        if dia.weekday() not in dias:
+            continue
+        inicio = dia + timedelta(minutes=abertura)
+        fim = inicio + timedelta(minutes=duracao + TOLERANCIA_FECHAMENTO_MIN)
+        if inicio <= agora < fim:
+            return True, None
+        if inicio > agora and proxima is None:
+            proxima = inicio
+    return False, proxima
+
+def ttl_mercado(ticker, agora=None):
+    """Validade em segundos: curta com o mercado aberto, até a próxima abertura com ele fechado"""
+    aberto, proxima = situacao_mercado(ticker, agora)
+    if aberto or proxima is None:
+        return TTL_MERCADO_ABERTO
+    agora = agora or datetime.now(proxima.tzinfo)
+    return max(TTL_MERCADO_ABERTO, (proxima - agora).total_seconds())
+
+# **Cache de preços - LRU limitado por bytes, armazenamento compacto**
+CACHE_PRECOS_MB = float(os.environ.get('SCREENER_CACHE_MB', 256))
+
+COLUNAS_PRECO = ('Open', 'High', 'Low', 'Close')
+
+def compactar_historico(hist):
+    """OHLC em float32, volume inteiro e sem colunas não usadas (dividendos, desdobramentos)"""
+    compacto = pd.DataFrame(
+        {coluna: hist[coluna].to_numpy(dtype='float32') for coluna in COLUNAS_PRECO},
+        index=hist.index
+    )
+    compacto['Volume'] = hist['Volume'].fillna(0).to_numpy().astype('int64')
+    return compacto
+
+def copiar_entrada(hist, info):
+    """Cópia de (histórico, info) para o chamador: alterá-la nunca afeta o cache compartilhado"""
+    return (
+        # Copy-on-write do pandas 3: a cópia rasa não copia dados e escritas nela não chegam ao cache
+        hist.copy(deep=False) if hist is not None else None,
+        copy.deepcopy(info) if info is not None else None
+    )
+
+def _tamanho_info(info):
+    """Estimativa em bytes do dicionário de fundamentos"""
+    if not info:
+        return 0
+    return sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in info.items())
+
+class CachePrecos:
+    """LRU de (histórico, info) por (ticker, período) com orçamento de memória em bytes"""
+
+    def __init__(self, limite_bytes):
+        self.limite_bytes = limite_bytes
+        self.bytes_usados = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        """Retorna (encontrado, hist, info) como cópias do chamador (ver copiar_entrada)"""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                return False, None, None
+            expira, hist, info, _ = entrada
+            if expira < time.time():
+                self._remover(chave)
+                return False, None, None
+            self._entradas.move_to_end(chave)
+
+        return (True, *copiar_entrada(hist, info))
+
+    def guardar(self, chave, hist, info, ttl=TTL_MERCADO_ABERTO, compactar=True):
+        """Armazena a entrada e despeja as menos usadas até caber no orçamento"""
+        if hist is not None and compactar:
+            hist = compactar_historico(hist)
+        tamanho = (int(hist.memory_usage(index=True).sum()) if hist is not None else 0) + _tamanho_info(info)
+
+        with self._lock:
+            if chave in self._entradas:
+                self._remover(chave)
+            self._entradas[chave] = (time.time() + ttl, hist, info, tamanho)
+            self.bytes_usados += tamanho
+
+            despejos = 0
+            while self.bytes_usados > self.limite_bytes and len(self._entradas) > 1:
+                self._remover(next(iter(self._entradas)))
+                despejos += 1
+
+            bytes_usados, entradas = self.bytes_usados, len(self._entradas)
+
+        if despejos:
+            metricas.incrementar('screener_cache_evictions_total', despejos,
+                                 ajuda='Entradas despejadas do cache de preços')
+        metricas.definir('screener_cache_bytes', bytes_usados, ajuda='Bytes ocupados pelo cache de preços')
+        metricas.definir('screener_cache_entries', entradas, ajuda='Entradas no cache de preços')
+        return hist
+
+    def _remover(self, chave):
+        *_, tamanho = self._entradas.pop(chave)
+        self.bytes_usados -= tamanho
+
+@st.cache_resource(show_spinner=False)
+def obter_cache_precos():
+    """Cache de preços único por processo, compartilhado entre sessões"""
+    return CachePrecos(int(CACHE_PRECOS_MB * 1024 * 1024))
+
+class RequisicoesUnicas:
+    """Single-flight: chamadas concorrentes com a mesma chave compartilham uma única busca"""
+
+    def __init__(self):
+        self._em_voo = {}
+        self._lock = threading.Lock()
+
+    def executar(self, chave, funcao):
+        """Executa funcao() uma vez por chave em voo; quem chega depois espera e recebe o mesmo resultado"""
+        with self._lock:
+            voo = self._em_voo.get(chave)
+            lider = voo is None
+            if lider:
+                voo = self._em_voo[chave] = {'evento': threading.Event(), 'resultado': None, 'erro': None}
+
+        if not lider:
+            metricas.incrementar('screener_fetch_coalesced_total',
+                                 ajuda='Requisições atendidas por uma busca já em andamento', kind=chave[-1])
+            voo['evento'].wait()
+            if voo['erro'] is not None:
+                raise voo['erro']
+            return voo['resultado']
+
+        try:
+            voo['resultado'] = funcao()
+            return voo['resultado']
+        except Exception as erro:
+            voo['erro'] = erro
+            raise
+        finally:
+            with self._lock:
+                del self._em_voo[chave]
+            voo['evento'].set()
+
+@st.cache_resource(show_spinner=False)
+def obter_requisicoes_unicas():
+    """Coordenador de buscas em voo único por processo"""
+    return RequisicoesUnicas()
+
+def obter_info(ticker, stock=None):
+    """Fundamentos (.info) pelo cache de preços: snapshot e histórico compartilham uma única busca"""
+    cache = obter_cache_precos()
+    encontrado, _, info = cache.obter((ticker, 'info'))
+    if encontrado:
+        return info
+    info = obter_requisicoes_unicas().executar(
+        (ticker, None, 'info'), lambda: (stock or yf.Ticker(ticker)).info
+    )
+    if info:
+        cache.guardar((ticker, 'info'), None, info, ttl_mercado(ticker))
+    return info
+
+# **Cache compartilhado entre processos (SQLite em disco ou servidor Redis)**
+CACHE_COMPARTILHADO_URL = os.environ.get('SCREENER_SHARED_CACHE')
+CACHE_COMPARTILHADO_VERSAO = 1  # incrementar ao mudar o formato gravado
+RESULTADOS_TTL = 300
+
+class BackendSQLite:
+    """Chave/valor com expiração em arquivo SQLite (WAL), visível a todos os processos da máquina"""
+
+    LIMPEZA_A_CADA = 200
+
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self._gravacoes = 0
+        conn = self._conectar()
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    chave TEXT PRIMARY KEY,
+                    expira REAL NOT NULL,
+                    valor BLOB NOT NULL
+                ) WITHOUT ROWID
+            """)
+        finally:
+            conn.close()
+
+    def _conectar(self):
+        return sqlite3.connect(self.arquivo, timeout=30, isolation_level=None)
+
+    def obter(self, chave):
+        conn = self._conectar()
+        try:
+            linha = conn.execute(
+                "SELECT valor FROM cache WHERE chave = ? AND expira > ?", (chave, time.time())
+            ).fetchone()
+            return linha[0] if linha else None
+        finally:
+            conn.close()
+
+    def guardar(self, chave, valor, ttl):
+        conn = self._conectar()
+        try:
+            conn.execute("INSERT OR REPLACE INTO cache (chave, expira, valor) VALUES (?, ?, ?)",
+                         (chave, time.time() + ttl, valor))
+            self._gravacoes += 1
+            if self._gravacoes % self.LIMPEZA_A_CADA == 0:
+                conn.execute("DELETE FROM cache WHERE expira <= ?", (time.time(),))
+        finally:
+            conn.close()
+
+class BackendRedis:
+    """Chave/valor em servidor compatível com Redis (expiração nativa)"""
+
+    def __init__(self, url):
+        import redis  # dependência opcional, só exigida com SCREENER_SHARED_CACHE=redis://...
+        self.cliente = redis.Redis.from_url(url)
+
+    def obter(self, chave):
+        return self.cliente.get(chave)
+
+    def guardar(self, chave, valor, ttl):
+        self.cliente.set(chave, valor, ex=max(1, int(ttl)))
+
+def _json_padrao(obj):
+    """Converte escalares numpy e datas para JSON"""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (datetime, pd.Timestamp)):
+        return obj.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(obj).__name__}")
+
+class CacheCompartilhado:
+    """Chaves versionadas e valores comprimidos (Parquet zstd para frames, JSON zlib para o resto)"""
+
+    def __init__(self, backend, versao=CACHE_COMPARTILHADO_VERSAO):
+        self.backend = backend
+        self.versao = versao
+
+    def _chave(self, tipo, partes):
+        return ':'.join(['screener', f"v{self.versao}", tipo, *map(str, partes)])
+
+    def _ler(self, tipo, partes):
+        # Falhas do backend nunca derrubam a análise: viram miss
+        try:
+            valor = self.backend.obter(self._chave(tipo, partes))
+        except Exception:
+            metricas.incrementar('screener_shared_cache_errors_total',
+                                 ajuda='Falhas no cache compartilhado', kind=tipo)
+            return None
+        metricas.incrementar('screener_shared_cache_requests_total',
+                             ajuda='Consultas ao cache compartilhado',
+                             kind=tipo, result='miss' if valor is None else 'hit')
+        return valor
+
+    def _gravar(self, tipo, partes, valor, ttl):
+        try:
+            self.backend.guardar(self._chave(tipo, partes), valor, ttl)
+        except Exception:
+            metricas.incrementar('screener_shared_cache_errors_total',
+                                 ajuda='Falhas no cache compartilhado', kind=tipo)
+
+    def obter_json(self, tipo, partes):
+        valor = self._ler(tipo, partes)
+        return None if valor is None else json.loads(zlib.decompress(valor))
+
+    def guardar_json(self, tipo, partes, dados, ttl):
+        corpo = json.dumps(dados, default=_json_padrao, ensure_ascii=False).encode('utf-8')
+        self._gravar(tipo, partes, zlib.compress(corpo, 6), ttl)
+
+    def obter_frame(self, tipo, partes):
+        valor = self._ler(tipo, partes)
+        return None if valor is None else pq.read_table(pa.BufferReader(valor)).to_pandas()
+
+    def guardar_frame(self, tipo, partes, df, ttl):
+        destino = pa.BufferOutputStream()
+        pq.write_table(pa.Table.from_pandas(df), destino, compression='zstd')
+        self._gravar(tipo, partes, destino.getvalue().to_pybytes(), ttl)
+
+@st.cache_resource(show_spinner=False)
+def obter_cache_compartilhado():
+    """Cache compartilhado configurado por SCREENER_SHARED_CACHE (None quando desativado)"""
+    url = CACHE_COMPARTILHADO_URL
+    if not url:
+        return None
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return CacheCompartilhado(BackendRedis(url))
+    return CacheCompartilhado(BackendSQLite(url.removeprefix('sqlite:///')))
+
+# **Snapshot diário de fundamentos e liquidez (filtros antes de buscar preços)**
+# averageVolume é de 3 meses e o filtro exato usa 20 barras: só descarta bem abaixo do mínimo
+MARGEM_VOLUME_SNAPSHOT = 0.5
+class SnapshotFundamentos:
+    """Tabela SQLite com P/E, ROE, volume médio e nome por ticker, renovada uma vez por dia"""
+
+    def __init__(self, arquivo_db="fundamentals_snapshot.sqlite3"):
+        self.arquivo_db = arquivo_db
+        conn = self._conectar()
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS fundamentos (
+                    ticker TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    nome TEXT,
+                    pe REAL,
+                    roe REAL,
+                    volume_medio REAL
+                ) WITHOUT ROWID
+            """)
+        finally:
+            conn.close()
+
+    def _conectar(self):
+        return sqlite3.connect(self.arquivo_db, timeout=30, isolation_level=None)
+
+    @staticmethod
+    def _buscar(ticker):
+        """Linha do snapshot a partir do .info (None em caso de falha)"""
+        try:
+            info = obter_info(ticker)
+        except Exception:
+            return None
+        if not info:
+            return None
+        return (ticker, info.get('longName') or info.get('shortName') or ticker,
+                info.get('trailingPE'), info.get('returnOnEquity'), info.get('averageVolume'))
+
+    def obter(self, tickers):
+        """Snapshot do dia para os tickers; busca em paralelo apenas os ausentes ou de outro dia"""
+        hoje = datetime.now().date().isoformat()
+        conn = self._conectar()
+        try:
+            marcadores = ','.join('?' * len(tickers))
+            linhas = conn.execute(
+                f"SELECT ticker, nome, pe, roe, volume_medio FROM fundamentos "
+                f"WHERE data = ? AND ticker IN ({marcadores})", (hoje, *tickers)
+            ).fetchall() if tickers else []
+
+            presentes = {linha[0] for linha in linhas}
+            faltantes = [t for t in tickers if t not in presentes]
+            if faltantes:
+                with ThreadPoolExecutor(max_workers=VALIDACAO_MAX_THREADS) as executor:
+                    novas = [linha for linha in executor.map(self._buscar, faltantes) if linha]
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO fundamentos (ticker, data, nome, pe, roe, volume_medio) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(t, hoje, nome, pe, roe, volume) for t, nome, pe, roe, volume in novas]
+                )
+                conn.execute("COMMIT")
+                linhas += novas
+        finally:
+            conn.close()
+
+        snapshot = pd.DataFrame(linhas, columns=['ticker', 'nome', 'pe', 'roe', 'volume_medio'])
+        return snapshot.set_index('ticker').astype({'pe': 'float64', 'roe': 'float64', 'volume_medio': 'float64'})
+
+    def filtrar(self, tickers, volume_min=None, pe_max=None):
+        """Descarta quem não pode passar nos filtros baratos; retorna (aprovados, descartados)"""
+        # Sem dado no snapshot (ou P/E não positivo, tratado como N/A) o ticker segue adiante
+        snapshot = self.obter(list(tickers)).reindex(list(tickers))
+        reprovado = pd.Series(False, index=snapshot.index)
+        if volume_min is not None:
+            reprovado |= snapshot['volume_medio'] < volume_min * MARGEM_VOLUME_SNAPSHOT
+        if pe_max is not None:
+            reprovado |= (snapshot['pe'] > 0) & (snapshot['pe'] > pe_max)
+
+        aprovados = [t for t in tickers if not reprovado[t]]
+        descartados = snapshot[reprovado.to_numpy()]
+        return aprovados, descartados
+
+@st.cache_resource(show_spinner=False)
+def obter_snapshot_fundamentos():
+    """Snapshot de fundamentos único por processo"""
+    return SnapshotFundamentos()
 
 class GerenciadorAtivos:
-    """Gerenciador de base de dados de ativos"""
+    """Gerenciador de base de dados de ativos (SQLite indexado)"""
     
-    def __init__(self, arquivo_db="assets_database.json"):
+    def __init__(self, arquivo_db="assets_database.sqlite3", arquivo_json="assets_database.json"):
         self.arquivo_db = arquivo_db
-        self.dados = self.carregar_dados()
+        self.arquivo_json = arquivo_json
+        self.criar_esquema()
+        self.migrar_json()
     
-    def carregar_dados(self):
-        """Carrega dados do arquivo JSON"""
+    def _conectar(self):
+        """Abre conexão com espera em caso de escrita concorrente"""
+        conn = sqlite3.connect(self.arquivo_db, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+    
+    @contextmanager
+    def _transacao(self):
+        """Transação de escrita exclusiva (BEGIN IMMEDIATE) com rollback em erro"""
+        conn = self._conectar()
         try:
-            with open(self.arquivo_db, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return self.criar_base_inicial()
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
     
-    def salvar_dados(self):
-        """Salva dados no arquivo JSON"""
-        with open(self.arquivo_db, 'w', encoding='utf-8') as f:
-            json.dump(self.dados, f, ensure_ascii=False, indent=2)
+    def _consultar(self, sql, parametros=()):
+        conn = self._conectar()
+        try:
+            return conn.execute(sql, parametros).fetchall()
+        finally:
+            conn.close()
+    
+    def criar_esquema(self):
+        """Cria tabelas e índices caso ainda não existam"""
+        conn = self._conectar()
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS categorias (
+                    id TEXT PRIMARY KEY,
+                    nome TEXT NOT NULL,
+                    descricao TEXT NOT NULL DEFAULT '',
+                    ordem INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS tickers (
+                    categoria TEXT NOT NULL REFERENCES categorias(id) ON DELETE CASCADE,
+                    ticker TEXT NOT NULL,
+                    ordem INTEGER NOT NULL,
+                    PRIMARY KEY (categoria, ticker)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_tickers_ordem ON tickers (categoria, ordem);
+                CREATE INDEX IF NOT EXISTS idx_tickers_ticker ON tickers (ticker);
+                CREATE TABLE IF NOT EXISTS meta (
+                    chave TEXT PRIMARY KEY,
+                    valor TEXT
+                );
+                CREATE TABLE IF NOT EXISTS regras (
+                    categoria TEXT NOT NULL REFERENCES categorias(id) ON DELETE CASCADE,
+                    ordem INTEGER NOT NULL,
+                    texto TEXT NOT NULL,
+                    PRIMARY KEY (categoria, ordem)
+                ) WITHOUT ROWID;
+            """)
+        finally:
+            conn.close()
+    
+    def migrar_json(self):
+        """Migra o arquivo JSON legado (ou a base inicial) uma única vez"""
+        if self._consultar("SELECT 1 FROM meta WHERE chave = 'migracao_json'"):
+            return
+        
+        try:
+            with open(self.arquivo_json, 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+        except FileNotFoundError:
+            dados = self.criar_base_inicial()
+        
+        with self._transacao() as conn:
+            # Outra sessão pode ter migrado enquanto esperávamos o lock
+            if conn.execute("SELECT 1 FROM meta WHERE chave = 'migracao_json'").fetchone():
+                return
+            
+            for ordem, (categoria, info) in enumerate(dados.items()):
+                conn.execute(
+                    "INSERT OR IGNORE INTO categorias (id, nome, descricao, ordem) VALUES (?, ?, ?, ?)",
+                    (categoria, info.get('nome', categoria), info.get('descricao', ''), ordem)
+                )
+                tickers = list(dict.fromkeys(t.upper() for t in info.get('tickers', [])))
+                conn.executemany(
+                    "INSERT OR IGNORE INTO tickers (categoria, ticker, ordem) VALUES (?, ?, ?)",
+                    [(categoria, ticker, i) for i, ticker in enumerate(tickers)]
+                )
+            
+            conn.execute(
+                "INSERT INTO meta (chave, valor) VALUES ('migracao_json', ?)",
+                (datetime.now().isoformat(),)
+            )
     
     def criar_base_inicial(self):
         """Cria base inicial de dados expandida"""
@@ -482,39 +1169,152 @@ class GerenciadorAtivos:
             }
         }
         
-        self.salvar_dados_iniciais(dados_iniciais)
         return dados_iniciais
     
-    def salvar_dados_iniciais(self, dados):
-        """Salva dados iniciais no arquivo"""
-        with open(self.arquivo_db, 'w', encoding='utf-8') as f:
-            json.dump(dados, f, ensure_ascii=False, indent=2)
-    
     def obter_categorias(self):
-        return list(self.dados.keys())
+        return [row[0] for row in self._consultar("SELECT id FROM categorias ORDER BY ordem")]
     
     def obter_tickers_categoria(self, categoria):
-        return self.dados.get(categoria, {}).get('tickers', [])
+        return [row[0] for row in self._consultar(
+            "SELECT ticker FROM tickers WHERE categoria = ? ORDER BY ordem", (categoria,)
+        )]
     
     def obter_info_categoria(self, categoria):
-        return self.dados.get(categoria, {})
+        linhas = self._consultar("SELECT nome, descricao FROM categorias WHERE id = ?", (categoria,))
+        if not linhas:
+            return {}
+        nome, descricao = linhas[0]
+        return {
+            'nome': nome,
+            'descricao': descricao,
+            'tickers': self.obter_tickers_categoria(categoria)
+        }
+    
+    def obter_regras(self, categoria):
+        return [row[0] for row in self._consultar(
+            "SELECT texto FROM regras WHERE categoria = ? ORDER BY ordem", (categoria,)
+        )]
+    
+    def salvar_regras(self, categoria, textos):
+        """Valida (compila) e substitui as regras da categoria; ValueError se alguma for inválida"""
+        textos = [t.strip() for t in textos if t.strip()]
+        ConjuntoRegras(textos)
+        
+        with self._transacao() as conn:
+            conn.execute("DELETE FROM regras WHERE categoria = ?", (categoria,))
+            conn.executemany(
+                "INSERT INTO regras (categoria, ordem, texto) VALUES (?, ?, ?)",
+                [(categoria, ordem, texto) for ordem, texto in enumerate(textos)]
+            )
+        return len(textos)
     
     def adicionar_ticker(self, categoria, ticker):
-        if categoria in self.dados:
-            if ticker not in self.dados[categoria]['tickers']:
-                self.dados[categoria]['tickers'].append(ticker.upper())
-                self.salvar_dados()
-                return True
-        return False
+        return bool(self.adicionar_tickers(categoria, [ticker]))
     
     def remover_ticker(self, categoria, ticker):
-        if categoria in self.dados:
-            if ticker in self.dados[categoria]['tickers']:
-                self.dados[categoria]['tickers'].remove(ticker)
-                self.salvar_dados()
-                return True
+        return bool(self.remover_tickers(categoria, [ticker]))
+    
+    def adicionar_tickers(self, categoria, tickers):
+        """Adiciona vários tickers em uma única transação; retorna os inseridos"""
+        normalizados = list(dict.fromkeys(t.strip().upper() for t in tickers if t and t.strip()))
+        
+        with self._transacao() as conn:
+            if not conn.execute("SELECT 1 FROM categorias WHERE id = ?", (categoria,)).fetchone():
+                return []
+            
+            existentes = {row[0] for row in conn.execute(
+                "SELECT ticker FROM tickers WHERE categoria = ?", (categoria,)
+            )}
+            novos = [t for t in normalizados if t not in existentes]
+            
+            ultima_ordem = conn.execute(
+                "SELECT COALESCE(MAX(ordem), -1) FROM tickers WHERE categoria = ?", (categoria,)
+            ).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO tickers (categoria, ticker, ordem) VALUES (?, ?, ?)",
+                [(categoria, ticker, ultima_ordem + 1 + i) for i, ticker in enumerate(novos)]
+            )
+        
+        return novos
+    
+    def criar_categoria(self, categoria, nome, descricao="", tickers=()):
+        """Cria uma categoria já com seus tickers em uma única transação"""
+        normalizados = list(dict.fromkeys(t.strip().upper() for t in tickers if t and t.strip()))
+
+        with self._transacao() as conn:
+            if conn.execute("SELECT 1 FROM categorias WHERE id = ?", (categoria,)).fetchone():
+                return False
+
+            ordem = conn.execute("SELECT COALESCE(MAX(ordem), -1) + 1 FROM categorias").fetchone()[0]
+            conn.execute(
+                "INSERT INTO categorias (id, nome, descricao, ordem) VALUES (?, ?, ?, ?)",
+                (categoria, nome or categoria, descricao, ordem)
+            )
+            conn.executemany(
+                "INSERT INTO tickers (categoria, ticker, ordem) VALUES (?, ?, ?)",
+                [(categoria, ticker, i) for i, ticker in enumerate(normalizados)]
+            )
+
+        return True
+
+    def remover_tickers(self, categoria, tickers):
+        """Remove vários tickers em uma única transação; retorna a quantidade removida"""
+        with self._transacao() as conn:
+            cursor = conn.executemany(
+                "DELETE FROM tickers WHERE categoria = ? AND ticker = ?",
+                [(categoria, t.strip().upper()) for t in tickers if t and t.strip()]
+            )
+            return cursor.rowcount
+
+# **Importação em lote de tickers**
+VALIDACAO_MAX_THREADS = 16
+
+CABECALHOS_TICKER = ('ticker', 'tickers', 'symbol', 'symbols', 'ativo', 'ativos', 'codigo', 'código', 'papel')
+
+def extrair_tickers(texto="", arquivo_csv=None):
+    """Extrai tickers de texto colado e/ou CSV, sem duplicatas e em maiúsculas"""
+    brutos = re.split(r'[\s,;]+', texto or '')
+
+    if arquivo_csv is not None:
+        conteudo = arquivo_csv.getvalue().decode('utf-8-sig')
+        linhas = [re.split(r'[,;\t]', linha) for linha in conteudo.splitlines() if linha.strip()]
+        if linhas:
+            # Usa a coluna de cabeçalho conhecido; sem cabeçalho, a primeira coluna
+            cabecalho = [c.strip().strip('"').lower() for c in linhas[0]]
+            coluna = next((i for i, c in enumerate(cabecalho) if c in CABECALHOS_TICKER), None)
+            if coluna is None:
+                brutos += [linha[0] for linha in linhas]
+            else:
+                brutos += [linha[coluna] for linha in linhas[1:] if len(linha) > coluna]
+
+    # Cabeçalho que sobrar (colado no texto ou em coluna sem nome conhecido) não vira ticker
+    limpos = (t.strip().strip('"') for t in brutos)
+    return list(dict.fromkeys(t.upper() for t in limpos if t and t.lower() not in CABECALHOS_TICKER))
+
+def validar_ticker(ticker):
+    """Verifica no Yahoo Finance se o ticker possui cotações recentes"""
+    try:
+        return not yf.Ticker(ticker).history(period="5d", timeout=10).empty
+    except Exception:
         return False
 
+def validar_tickers(tickers, ao_progredir=None):
+    """Valida tickers em paralelo; retorna (válidos, inválidos) na ordem de entrada"""
+    status = {}
+    with ThreadPoolExecutor(max_workers=VALIDACAO_MAX_THREADS) as executor:
+        futuros = {executor.submit(validar_ticker, t): t for t in tickers}
+        for i, futuro in enumerate(as_completed(futuros), start=1):
+            status[futuros[futuro]] = futuro.result()
+            if ao_progredir:
+                ao_progredir(i, len(tickers))
+
+    validos = [t for t in tickers if status.get(t)]
+    invalidos = [t for t in tickers if not status.get(t)]
+    return validos, invalidos
+
+SETUPS_ESTRATEGIA = ("Pullback EMA21", "Breakout", "Pullback EMA21 (baixa)", "Breakdown")
+AQUECIMENTO_SETUPS = 50  # barras até a EMA 50 existir; antes disso não há setup
+
 class EstrategiaNegociacao:
     """Classe para calcular estratégias automáticas de trading"""
     
@@ -550,6 +1350,42 @@ class EstrategiaNegociacao:
         else:
             return EstrategiaNegociacao._estrategia_neutra(preco_atual, atr, ema21)
     
+    @staticmethod
+    def classificar_setups(painel):
+        """Setup, entrada, stop e alvos em todas as barras (regras de compra/venda vetorizadas)"""
+        preco = painel['Close'].to_numpy(dtype='float64')
+        atr = painel['ATR'].to_numpy(dtype='float64')
+        ema21 = painel['EMA_21'].to_numpy(dtype='float64')
+        decisao = painel['decisao'].to_numpy()
+        
+        # Barras de aquecimento de cada ticker (ou ATR ainda zero) não geram setup
+        aquecido = (painel.groupby('ticker', sort=False).cumcount().to_numpy() >= AQUECIMENTO_SETUPS) & (atr > 0)
+        
+        # Mesmos limiares de _estrategia_compra/_estrategia_venda
+        compra = np.isin(decisao, ["Compra", "Forte Compra"]) & aquecido
+        venda = np.isin(decisao, ["Venda", "Forte Venda"]) & aquecido
+        perto_ema21 = np.abs(preco - ema21) / preco <= 0.02
+        condicoes = [compra & perto_ema21, compra, venda & perto_ema21, venda]
+        
+        entrada = np.select(condicoes, [
+            np.fmax(preco, ema21 * 1.005),
+            np.maximum(preco * 1.002, painel['High_20'].to_numpy(dtype='float64') * 1.001),
+            np.fmin(preco, ema21 * 0.995),
+            np.minimum(preco * 0.998, painel['Low_20'].to_numpy(dtype='float64') * 0.999)
+        ], np.nan)
+        sentido = np.select([compra, venda], [1.0, -1.0], np.nan)
+        multiplicador_stop = np.where(perto_ema21, 2.0, 2.2)
+        multiplicador_alvo = np.where(np.isin(decisao, ["Forte Compra", "Forte Venda"]), 4.0, 3.0)
+        
+        return pd.DataFrame({
+            'setup': np.select(condicoes, list(SETUPS_ESTRATEGIA), ""),
+            'entrada': entrada,
+            'stop_loss': entrada - sentido * atr * multiplicador_stop,
+            'alvo_1': entrada + sentido * atr * multiplicador_alvo * 0.6,
+            'alvo_2': entrada + sentido * atr * multiplicador_alvo,
+            'risco_retorno': np.where(atr > 0, multiplicador_alvo / multiplicador_stop, 0.0)
+        }, index=painel.index)
+    
     @staticmethod
     def _estrategia_compra(preco, atr, ema9, ema21, ema50, rsi, high_20, low_20, decisao):
         """Estratégia otimizada para compra com verificações robustas"""
@@ -652,74 +1488,821 @@ class EstrategiaNegociacao:
             'detalhes': 'Aguardar rompimento da EMA21 ou consolidação'
         }
 
+# **Modo Intraday - janela deslizante em buffer circular**
+INTERVALOS_INTRADAY = {'5m': '5d', '15m': '1mo', '60m': '3mo'}  # intervalo -> período da carga inicial
+DIAS_PERIODO_INTRADAY = {'5d': 5, '1mo': 30, '3mo': 90}
+JANELA_INTRADAY = 400
+
+class BufferCircular:
+    """Janela fixa de barras OHLCV em arrays pré-alocados (memória constante)"""
+
+    COLUNAS = ('Open', 'High', 'Low', 'Close', 'Volume')
+
+    def __init__(self, capacidade=JANELA_INTRADAY):
+        self.capacidade = capacidade
+        self.tempos = np.zeros(capacidade, dtype='int64')
+        self.valores = np.zeros((capacidade, len(self.COLUNAS)), dtype='float64')
+        self.tamanho = 0
+        self.inicio = 0
+        self.tz = None
+
+    def _posicao_ultima(self):
+        return (self.inicio + self.tamanho - 1) % self.capacidade
+
+    @property
+    def ultimo_tempo(self):
+        """Timestamp (ns, UTC) da barra mais recente"""
+        return int(self.tempos[self._posicao_ultima()]) if self.tamanho else None
+
+    def anexar(self, df):
+        """Grava barras novas sobre as mais antigas; a barra em formação é atualizada"""
+        df = df.dropna(subset=['Close'])
+        if df.empty:
+            return 0
+        if self.tz is None:
+            self.tz = df.index.tz
+
+        tempos = df.index.as_unit('ns').asi8
+        valores = df[list(self.COLUNAS)].to_numpy(dtype='float64')
+
+        ultimo = self.ultimo_tempo
+        if ultimo is not None:
+            mesma_barra = tempos == ultimo
+            if mesma_barra.any():
+                self.valores[self._posicao_ultima()] = valores[mesma_barra][-1]
+            novas = tempos > ultimo
+            tempos, valores = tempos[novas], valores[novas]
+
+        n = len(tempos)
+        if n == 0:
+            return 0
+        if n > self.capacidade:
+            tempos, valores = tempos[-self.capacidade:], valores[-self.capacidade:]
+            n = self.capacidade
+
+        fim = (self.inicio + self.tamanho) % self.capacidade
+        posicoes = (fim + np.arange(n)) % self.capacidade
+        self.tempos[posicoes] = tempos
+        self.valores[posicoes] = valores
+
+        excedente = max(0, self.tamanho + n - self.capacidade)
+        self.tamanho = min(self.capacidade, self.tamanho + n)
+        self.inicio = (self.inicio + excedente) % self.capacidade
+        return n
+
+    def para_dataframe(self):
+        """DataFrame em ordem cronológica com as barras da janela"""
+        ordem = (self.inicio + np.arange(self.tamanho)) % self.capacidade
+        indice = pd.to_datetime(self.tempos[ordem], utc=True)
+        if self.tz is not None:
+            indice = indice.tz_convert(self.tz)
+        return pd.DataFrame(self.valores[ordem], index=indice, columns=list(self.COLUNAS))
+
+class ArmazemIntraday:
+    """Buffers circulares por (ticker, intervalo), compartilhados entre sessões"""
+
+    def __init__(self, capacidade=JANELA_INTRADAY):
+        self.capacidade = capacidade
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def atualizar(self, ticker, intervalo):
+        """Carga inicial completa; depois busca desde a última barra guardada e anexa as novas"""
+        chave = (ticker, intervalo)
+        with self._lock:
+            buffer = self._buffers.get(chave)
+
+        periodo = INTERVALOS_INTRADAY[intervalo]
+        inicio = None
+        if buffer is not None and buffer.ultimo_tempo is not None:
+            ultimo = pd.Timestamp(buffer.ultimo_tempo, unit='ns', tz='UTC')
+            # start= cobre noites, fins de semana e feriados sem buracos; lacuna maior que a
+            # carga inicial recomeça o buffer (as barras antigas não seriam contíguas)
+            if pd.Timestamp.now(tz='UTC') - ultimo < pd.Timedelta(days=DIAS_PERIODO_INTRADAY[periodo]):
+                inicio = ultimo
+            else:
+                with self._lock:
+                    self._buffers.pop(chave, None)
+
+        mercado = classificar_mercado(ticker)
+        metricas.incrementar('screener_fetch_requests_total',
+                             ajuda='Requisições ao Yahoo Finance', market=mercado)
+        try:
+            if inicio is None:
+                buscar = lambda: yf.Ticker(ticker).history(
+                    period=periodo, interval=intervalo, auto_adjust=True, timeout=15)
+            else:
+                buscar = lambda: yf.Ticker(ticker).history(
+                    start=inicio.to_pydatetime(), interval=intervalo, auto_adjust=True, timeout=15)
+            hist = obter_requisicoes_unicas().executar(
+                (ticker, f"{inicio.value if inicio is not None else periodo}/{intervalo}", 'intraday'), buscar
+            )
+        except Exception:
+            metricas.incrementar('screener_fetch_errors_total',
+                                 ajuda='Falhas ao obter dados do Yahoo Finance',
+                                 market=mercado, reason='excecao')
+            hist = pd.DataFrame()
+
+        with self._lock:
+            buffer = self._buffers.get(chave)
+            if buffer is None:
+                buffer = BufferCircular(self.capacidade)
+            if not hist.empty:
+                buffer.anexar(hist)
+            if not buffer.tamanho:
+                return None
+            self._buffers[chave] = buffer
+            return buffer.para_dataframe()
+
+@st.cache_resource(show_spinner=False)
+def obter_armazem_intraday():
+    """Armazém intraday único por processo"""
+    return ArmazemIntraday()
+
+class SimuladorMonteCarlo:
+    """Probabilidade de atingir o alvo antes do stop por simulação de caminhos de preço"""
+
+    def __init__(self, caminhos=2000, horizonte=20, metodo='bootstrap', semente=42, lote=32):
+        self.caminhos = caminhos
+        self.horizonte = horizonte
+        self.metodo = metodo
+        self.semente = semente
+        self.lote = lote
+
+    def _simular_retornos(self, retornos, volatilidades, rngs):
+        """Log-retornos simulados (tickers x caminhos x passos), cada ticker com o próprio gerador"""
+        forma = (len(volatilidades), self.caminhos, self.horizonte)
+
+        if self.metodo == 'bootstrap':
+            # Reamostragem do histórico de cada ticker (matriz preenchida até o maior histórico)
+            tamanhos = np.array([len(r) for r in retornos])
+            historico = np.zeros((len(retornos), tamanhos.max()))
+            for k, r in enumerate(retornos):
+                historico[k, :len(r)] = r
+            sorteios = np.stack([rng.random(forma[1:]) for rng in rngs])
+            indices = (sorteios * tamanhos[:, None, None]).astype('int64')
+            return np.take_along_axis(historico[:, None, :], indices.reshape(len(retornos), 1, -1), axis=2).reshape(forma)
+
+        # ATR como aproximação do desvio diário
+        return np.stack([rng.standard_normal(forma[1:]) for rng in rngs]) * volatilidades[:, None, None]
+
+    @staticmethod
+    def _primeiro_toque(condicao):
+        """Passo do primeiro toque por caminho (horizonte quando nunca toca)"""
+        return np.where(condicao.any(axis=2), condicao.argmax(axis=2), condicao.shape[2])
+
+    def estimar(self, setups):
+        """Estima em lotes de tamanho fixo (memória limitada); retorna (prob. alvo 1, prob. alvo 2) em %"""
+        if not setups:
+            return np.array([]), np.array([])
+
+        resultados = [
+            self._estimar_lote(setups[inicio:inicio + self.lote])
+            for inicio in range(0, len(setups), self.lote)
+        ]
+        return (np.concatenate([prob_1 for prob_1, _ in resultados]),
+                np.concatenate([prob_2 for _, prob_2 in resultados]))
+
+    def _estimar_lote(self, setups):
+        """Probabilidades de um lote de setups vetorizadas em (tickers x caminhos x passos)"""
+        # Semente por ticker (crc32 é estável entre processos): independe da posição e dos vizinhos
+        rngs = [np.random.default_rng([self.semente, zlib.crc32(s['ticker'].encode('utf-8'))]) for s in setups]
+        retornos = [s['retornos'] for s in setups]
+        volatilidades = np.array([s['volatilidade'] for s in setups])
+        entrada = np.array([s['entrada'] for s in setups])[:, None, None]
+        stop = np.array([s['stop_loss'] for s in setups])[:, None, None]
+        alvo_1 = np.array([s['alvo_1'] for s in setups])[:, None, None]
+        alvo_2 = np.array([s['alvo_2'] for s in setups])[:, None, None]
+        direcao = np.array([1.0 if s['tipo'] == 'COMPRA' else -1.0 for s in setups])[:, None, None]
+
+        precos = entrada * np.exp(np.cumsum(self._simular_retornos(retornos, volatilidades, rngs), axis=2))
+
+        # Na venda os sinais se invertem: alvo abaixo e stop acima da entrada
+        toque_stop = self._primeiro_toque(direcao * (precos - stop) <= 0)
+        toque_alvo_1 = self._primeiro_toque(direcao * (precos - alvo_1) >= 0)
+        toque_alvo_2 = self._primeiro_toque(direcao * (precos - alvo_2) >= 0)
+
+        prob_1 = ((toque_alvo_1 < toque_stop) & (toque_alvo_1 < self.horizonte)).mean(axis=1) * 100
+        prob_2 = ((toque_alvo_2 < toque_stop) & (toque_alvo_2 < self.horizonte)).mean(axis=1) * 100
+        return prob_1, prob_2
+
+# Benchmark por mercado (sufixo do ticker) e janela da força relativa (~3 meses)
+BENCHMARKS = {'SA': '^BVSP', 'US': 'SPY', 'USD': 'BTC-USD', 'F': None}
+JANELA_FORCA_RELATIVA = 63
+
+# Reamostragem do histórico diário (MACD precisa de 26 + 9 barras; 5 anos dão ~60 barras mensais)
+TIMEFRAMES_REAMOSTRAGEM = {'Semanal': 'W-FRI', 'Mensal': 'MS'}
+MIN_BARRAS_TIMEFRAME = 35
+PERIODO_TIMEFRAMES = "5y"
+# Períodos diários mais curtos são fatiados do histórico de 5 anos (uma busca por ticker)
+JANELAS_PERIODO = {
+    '1mo': pd.DateOffset(months=1), '3mo': pd.DateOffset(months=3), '6mo': pd.DateOffset(months=6),
+    '1y': pd.DateOffset(years=1), '2y': pd.DateOffset(years=2)
+}
+
+# **Indicadores sob demanda - cada consumidor declara o que lê e quantas barras finais**
+# Barras de aquecimento antes da primeira barra pedida (≈5x o período das médias recursivas)
+AQUECIMENTO_INDICADORES = {
+    'EMA_9': 45, 'EMA_21': 105, 'EMA_50': 250, 'EMA_200': 1000,
+    'RSI': 70, 'MACD': 175, 'ATR': 70, 'BB': 20
+}
+INDICADORES_SCORE = ('EMA_9', 'EMA_21', 'EMA_50', 'RSI', 'MACD', 'ATR')
+INDICADORES_DIRECAO = ('EMA_9', 'EMA_21', 'EMA_50', 'RSI', 'MACD')
+BARRAS_SCORE = 20  # máximas, mínimas e volume das últimas 20 barras
+
+# **Regras de score personalizadas - "RSI < 30 and Close > EMA_200 -> +1.0 weight 0.2"**
+# variável disponível nas regras -> grupo de indicador que precisa ser calculado
+VARIAVEIS_REGRAS = {
+    'Open': None, 'High': None, 'Low': None, 'Close': None, 'Volume': None,
+    'EMA_9': 'EMA_9', 'EMA_21': 'EMA_21', 'EMA_50': 'EMA_50', 'EMA_200': 'EMA_200',
+    'RSI': 'RSI', 'MACD': 'MACD', 'MACD_Signal': 'MACD', 'MACD_Histogram': 'MACD',
+    'ATR': 'ATR', 'BB_Upper': 'BB', 'BB_Lower': 'BB', 'BB_Middle': 'BB',
+    'PE': None, 'ROE': None, 'Volume_Medio': None, 'RS': None
+}
+PADRAO_REGRA = re.compile(
+    r'^(?P<condicao>.+?)\s*->\s*(?P<score>[+-]?\d+(?:\.\d+)?)\s+(?:weight|peso)\s+(?P<peso>\d+(?:\.\d+)?)$',
+    re.IGNORECASE
+)
+
+# Amostra para a avaliação de teste ao salvar: valores comuns, zero e NaN em todas as variáveis
+AMOSTRA_REGRAS = np.array([1.0, 0.0, np.nan])
+
+def _booleano(node):
+    """Nó (da árvore original) que produz máscara booleana: comparação, and/or ou not"""
+    return isinstance(node, (ast.Compare, ast.BoolOp)) or (
+        isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not)
+    )
+
+def _definido(*termos):
+    """Máscara dos tickers em que nenhum termo é NaN (a negação não pode tornar NaN verdadeiro)"""
+    mascara = True
+    for termo in termos:
+        mascara = mascara & ~np.isnan(np.asarray(termo, dtype='float64'))
+    return mascara
+
+class _VetorizarCondicao(ast.NodeTransformer):
+    """Valida a condição e troca and/or/not por &, |, ~ (operações elemento a elemento)"""
+
+    COMPARACOES = (ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+    ARITMETICA = (ast.Add, ast.Sub, ast.Mult, ast.Div)
+
+    def visit_BoolOp(self, node):
+        # and/or/not só combinam comparações ("RSI and ..." viraria & sobre floats)
+        if not all(_booleano(v) for v in node.values):
+            raise ValueError("and/or só podem combinar comparações (ex.: RSI < 30 and Close > EMA_50)")
+        operador = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        valores = [self.visit(v) for v in node.values]
+        resultado = valores[0]
+        for valor in valores[1:]:
+            resultado = ast.BinOp(left=resultado, op=operador, right=valor)
+        return resultado
+
+    def visit_UnaryOp(self, node):
+        if isinstance(node.op, ast.Not):
+            if not _booleano(node.operand):
+                raise ValueError("not só pode negar comparações (ex.: not RSI > 70)")
+            operando = self.visit(node.operand)
+            # ~(X > c) seria verdadeiro onde X é NaN: restringe aos tickers com todos os termos definidos
+            termos = [copy.deepcopy(t) for c in ast.walk(operando) if isinstance(c, ast.Compare)
+                      for t in [c.left] + c.comparators]
+            definido = ast.Call(func=ast.Name(id='_definido', ctx=ast.Load()), args=termos, keywords=[])
+            return ast.BinOp(left=ast.UnaryOp(op=ast.Invert(), operand=operando), op=ast.BitAnd(), right=definido)
+        if isinstance(node.op, (ast.USub, ast.UAdd)):
+            if _booleano(node.operand):
+                raise ValueError("sinal aplicado a uma comparação")
+            return ast.UnaryOp(op=node.op, operand=self.visit(node.operand))
+        raise ValueError("operador unário não suportado")
+
+    def visit_Compare(self, node):
+        if not all(isinstance(op, self.COMPARACOES) for op in node.ops):
+            raise ValueError("comparação não suportada")
+        if any(_booleano(t) for t in [node.left] + node.comparators):
+            raise ValueError("comparações só podem ter valores numéricos dos dois lados")
+        termos = [self.visit(node.left)] + [self.visit(c) for c in node.comparators]
+        # a < b < c vira (a < b) & (b < c)
+        partes = [ast.Compare(left=termos[i], ops=[op], comparators=[termos[i + 1]])
+                  for i, op in enumerate(node.ops)]
+        resultado = partes[0]
+        for parte in partes[1:]:
+            resultado = ast.BinOp(left=resultado, op=ast.BitAnd(), right=parte)
+        return resultado
+
+    def visit_BinOp(self, node):
+        if not isinstance(node.op, self.ARITMETICA):
+            raise ValueError("operador aritmético não suportado")
+        if _booleano(node.left) or _booleano(node.right):
+            raise ValueError("comparações não podem entrar em contas aritméticas")
+        return ast.BinOp(left=self.visit(node.left), op=node.op, right=self.visit(node.right))
+
+    def visit_Name(self, node):
+        if node.id not in VARIAVEIS_REGRAS:
+            raise ValueError(f"variável desconhecida '{node.id}'")
+        return node
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise ValueError("apenas constantes numéricas são permitidas")
+        return node
+
+    def generic_visit(self, node):
+        raise ValueError(f"construção não suportada: {type(node).__name__}")
+
+class RegraScore:
+    """Uma regra compilada: condição vetorizada, score quando verdadeira e peso"""
+
+    def __init__(self, texto):
+        self.texto = texto.strip()
+        partes = PADRAO_REGRA.match(self.texto)
+        if not partes:
+            raise ValueError("formato esperado: <condição> -> <score> weight <peso>")
+
+        self.score = float(partes['score'])
+        self.peso = float(partes['peso'])
+        if not -1.0 <= self.score <= 1.0:
+            raise ValueError("o score deve estar entre -1 e +1")
+        if not 0.0 < self.peso <= 1.0:
+            raise ValueError("o peso deve estar entre 0 e 1")
+
+        try:
+            arvore = ast.parse(partes['condicao'], mode='eval')
+        except SyntaxError:
+            raise ValueError("condição com sintaxe inválida")
+        if not _booleano(arvore.body):
+            raise ValueError("a condição deve ser uma comparação")
+
+        corpo = _VetorizarCondicao().visit(arvore.body)
+        self.variaveis = sorted({n.id for n in ast.walk(corpo)
+                                 if isinstance(n, ast.Name) and n.id in VARIAVEIS_REGRAS})
+        self._codigo = compile(ast.fix_missing_locations(ast.Expression(body=corpo)), '<regra>', 'eval')
+
+        # Avaliação de teste: o que compila mas quebra em tempo de execução é recusado aqui
+        try:
+            self.avaliar({v: AMOSTRA_REGRAS for v in VARIAVEIS_REGRAS}, len(AMOSTRA_REGRAS))
+        except Exception as erro:
+            raise ValueError(f"a condição falha ao ser avaliada: {erro}")
+
+    def avaliar(self, colunas, n):
+        """Máscara booleana da condição para n tickers (NaN nunca satisfaz)"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mascara = eval(self._codigo, {'__builtins__': {}, '_definido': _definido}, colunas)
+        return np.broadcast_to(np.asarray(mascara, dtype=bool), (n,))
+
+class ConjuntoRegras:
+    """Regras de uma categoria, compiladas uma vez e avaliadas sobre a tabela do universo"""
+
+    def __init__(self, textos, ignorar_invalidas=False):
+        """ignorar_invalidas: regras gravadas que não compilam mais são puladas (em invalidas)"""
+        self.regras = []
+        self.invalidas = []
+        for numero, texto in enumerate(textos, 1):
+            if not texto.strip() or texto.strip().startswith('#'):
+                continue
+            try:
+                self.regras.append(RegraScore(texto))
+            except ValueError as erro:
+                if not ignorar_invalidas:
+                    raise ValueError(f"Regra {numero}: {erro}")
+                self.invalidas.append(f"Regra {numero}: {erro}")
+
+        grupos = {VARIAVEIS_REGRAS[v] for regra in self.regras for v in regra.variaveis} - {None}
+        self.indicadores = tuple(dict.fromkeys(INDICADORES_SCORE + tuple(sorted(grupos))))
+
+    def __bool__(self):
+        return bool(self.regras)
+
+    @staticmethod
+    def extrair_variaveis(df, info, forca_relativa=None, volume_medio=None):
+        """Linha da tabela de variáveis de um ticker (última barra + fundamentos)"""
+        ultimo = df.iloc[-1]
+        linha = {v: ultimo.get(v, np.nan) for v in VARIAVEIS_REGRAS if v in df.columns}
+        linha['PE'] = info.get('trailingPE') if info else None
+        linha['ROE'] = info.get('returnOnEquity') if info else None
+        linha['Volume_Medio'] = df['Volume'].tail(20).mean() if volume_medio is None else volume_medio
+        linha['RS'] = forca_relativa['rs'] if forca_relativa else None
+        return linha
+
+    def avaliar(self, linhas):
+        """Critérios das regras por ticker a partir das linhas de variáveis (uma passada por regra)"""
+        tabela = pd.DataFrame(linhas).reindex(columns=list(VARIAVEIS_REGRAS))
+        colunas = {v: tabela[v].to_numpy(dtype='float64') for v in VARIAVEIS_REGRAS}
+        n = len(tabela)
+
+        criterios = [{} for _ in range(n)]
+        for numero, regra in enumerate(self.regras, 1):
+            try:
+                mascara = regra.avaliar(colunas, n)
+            except Exception:
+                # Uma regra com erro fica inativa em vez de derrubar a categoria inteira
+                mascara = np.zeros(n, dtype=bool)
+            for i in range(n):
+                criterios[i][f'regra_{numero}'] = {
+                    'texto': regra.texto,
+                    'ativa': bool(mascara[i]),
+                    'score': regra.score if mascara[i] else 0.0,
+                    'peso': regra.peso
+                }
+        return criterios
+
+class _ProgressoNulo:
+    """Substitui barra/texto de progresso quando não há página para desenhar"""
+
+    def progress(self, *args, **kwargs):
+        pass
+
+    def text(self, *args, **kwargs):
+        pass
+
+    def empty(self):
+        pass
+
 class ScreenerAvancado:
     """Sistema de screener com estratégias automáticas"""
     
     def __init__(self):
         self.criterios_pesos = {
-            'tendencia_ema': 0.25,
-            'rsi': 0.20,
+            'tendencia_ema': 0.20,
+            'rsi': 0.15,
             'macd': 0.15,
             'pe_ratio': 0.15,
             'roe': 0.15,
-            'liquidez': 0.10
+            'liquidez': 0.10,
+            'forca_relativa': 0.10
         }
     
-    @st.cache_data(ttl=1800, show_spinner=False)
-    def obter_dados_acao(_self, ticker, periodo="1y"):
-        """Obtém dados históricos e fundamentais com cache"""
+    def obter_dados_acao(self, ticker, periodo="1y"):
+        """Obtém dados históricos e fundamentais pelo cache de preços, registrando hits/misses"""
+        if periodo in JANELAS_PERIODO:
+            hist, info = self.obter_dados_acao(ticker, PERIODO_TIMEFRAMES)
+            if hist is None:
+                return None, info
+            hist = hist.loc[hist.index[-1] - JANELAS_PERIODO[periodo]:]
+            return (hist if len(hist) >= 50 else None), info
+
+        cache = obter_cache_precos()
+        encontrado, hist, info = cache.obter((ticker, periodo))
+
+        metricas.incrementar(
+            'screener_cache_requests_total',
+            ajuda='Consultas ao cache de obter_dados_acao',
+            result='hit' if encontrado else 'miss'
+        )
+        if encontrado:
+            return hist, info
+
+        # Sessões simultâneas pedindo o mesmo ticker esperam a mesma busca (sem estouro no cache frio)
+        hist, info = obter_requisicoes_unicas().executar(
+            (ticker, periodo, 'historico'), lambda: self._carregar_dados(ticker, periodo)
+        )
+        return copiar_entrada(hist, info)
+
+    def _carregar_dados(self, ticker, periodo):
+        """Busca e guarda no cache; executado por uma única thread por chave"""
+        cache = obter_cache_precos()
+        encontrado, hist, info = cache.obter((ticker, periodo))
+        if encontrado:
+            # Outra busca terminou entre a consulta ao cache e a liderança do voo
+            return hist, info
+
+        # Com o mercado fechado a última barra não muda até a próxima abertura
+        ttl = ttl_mercado(ticker)
+
+        # Outro processo pode já ter buscado este ticker
+        compartilhado = obter_cache_compartilhado()
+        if compartilhado:
+            hist = compartilhado.obter_frame('historico', (ticker, periodo))
+            info = compartilhado.obter_json('info', (ticker,))
+            if hist is not None and info is not None:
+                return cache.guardar((ticker, periodo), hist, info, ttl), info
+
+        hist, info = self._buscar_dados(ticker, periodo)
+        if hist is None:
+            # Falha pode ser transitória: não guardar até a próxima abertura
+            return cache.guardar((ticker, periodo), hist, info), info
+
+        hist = cache.guardar((ticker, periodo), hist, info, ttl)
+        if compartilhado:
+            compartilhado.guardar_frame('historico', (ticker, periodo), hist, ttl)
+            compartilhado.guardar_json('info', (ticker,), info, ttl)
+        return hist, info
+
+    def _buscar_dados(self, ticker, periodo="1y"):
+        """Obtém dados históricos e fundamentais do Yahoo Finance"""
+        mercado = classificar_mercado(ticker)
+        inicio = time.perf_counter()
+        metricas.incrementar('screener_fetch_requests_total',
+                             ajuda='Requisições ao Yahoo Finance', market=mercado)
         try:
             stock = yf.Ticker(ticker)
             hist = stock.history(period=periodo, auto_adjust=True, timeout=15)
-            info = stock.info
-            
+            info = obter_info(ticker, stock)
+
             if hist.empty or len(hist) < 50:
+                metricas.incrementar('screener_fetch_errors_total',
+                                     ajuda='Falhas ao obter dados do Yahoo Finance',
+                                     market=mercado, reason='sem_dados')
                 return None, None
-            
+
             return hist, info
         except Exception:
+            metricas.incrementar('screener_fetch_errors_total',
+                                 ajuda='Falhas ao obter dados do Yahoo Finance',
+                                 market=mercado, reason='excecao')
             return None, None
+        finally:
+            metricas.observar('screener_fetch_duration_seconds', time.perf_counter() - inicio,
+                              BUCKETS_LATENCIA, ajuda='Latência das requisições ao Yahoo Finance',
+                              market=mercado)
     
-    def calcular_indicadores(self, df):
-        """Calcula indicadores técnicos completos"""
-        df = df.copy()
+    def calcular_indicadores(self, df, indicadores=None, barras=None):
+        """Calcula indicadores técnicos (todos, ou só os pedidos sobre a cauda necessária)"""
+        if indicadores is None:
+            indicadores = tuple(AQUECIMENTO_INDICADORES)
+        if barras is not None:
+            # Cauda = barras pedidas + aquecimento do indicador mais lento (fatia, sem cópia)
+            df = df.iloc[-(barras + max(AQUECIMENTO_INDICADORES[i] for i in indicadores)):]
         
+        novas = {}
         try:
             # EMAs
             for periodo in [9, 21, 50, 200]:
-                df[f'EMA_{periodo}'] = EMAIndicator(df['Close'], window=periodo).ema_indicator()
+                if f'EMA_{periodo}' in indicadores:
+                    novas[f'EMA_{periodo}'] = EMAIndicator(df['Close'], window=periodo).ema_indicator()
             
             # RSI
-            df['RSI'] = RSIIndicator(df['Close'], window=14).rsi()
+            if 'RSI' in indicadores:
+                novas['RSI'] = RSIIndicator(df['Close'], window=14).rsi()
             
             # MACD
-            macd = MACD(df['Close'])
-            df['MACD'] = macd.macd()
-            df['MACD_Signal'] = macd.macd_signal()
-            df['MACD_Histogram'] = macd.macd_diff()
+            if 'MACD' in indicadores:
+                macd = MACD(df['Close'])
+                novas['MACD'] = macd.macd()
+                novas['MACD_Signal'] = macd.macd_signal()
+                novas['MACD_Histogram'] = macd.macd_diff()
             
             # ATR
-            df['ATR'] = AverageTrueRange(df['High'], df['Low'], df['Close'], window=14).average_true_range()
+            if 'ATR' in indicadores:
+                novas['ATR'] = AverageTrueRange(df['High'], df['Low'], df['Close'], window=14).average_true_range()
             
             # Bollinger Bands
-            bb = BollingerBands(df['Close'], window=20, window_dev=2)
-            df['BB_Upper'] = bb.bollinger_hband()
-            df['BB_Lower'] = bb.bollinger_lband()
-            df['BB_Middle'] = bb.bollinger_mavg()
+            if 'BB' in indicadores:
+                bb = BollingerBands(df['Close'], window=20, window_dev=2)
+                novas['BB_Upper'] = bb.bollinger_hband()
+                novas['BB_Lower'] = bb.bollinger_lband()
+                novas['BB_Middle'] = bb.bollinger_mavg()
             
         except Exception as e:
             st.error(f"Erro ao calcular indicadores: {e}")
         
-        return df
+        # assign só acrescenta colunas; OHLCV continua compartilhado (copy-on-write)
+        df = df.assign(**novas)
+        return df.iloc[-barras:] if barras is not None else df
+    
+    def preparar_acao(self, ticker, intervalo=None, indicadores=INDICADORES_SCORE):
+        """Histórico, indicadores da cauda e fundamentos de um ticker (None sem dados)"""
+        if intervalo:
+            # Barras intraday da janela circular; fundamentos do cache diário
+            df = obter_armazem_intraday().atualizar(ticker, intervalo)
+            _, info = self.obter_dados_acao(ticker)
+            info = info or {}
+            if df is None or len(df) < 50:
+                return None
+        else:
+            df, info = self.obter_dados_acao(ticker)
+            
+            if df is None or info is None:
+                return None
+        
+        return df, self.calcular_indicadores(df, indicadores, BARRAS_SCORE), info
+    
+    def concluir_avaliacao(self, ticker, preparado, intervalo=None, forca_relativa=None, regras=None):
+        """Score, decisão e estratégia a partir de preparar_acao"""
+        df, df_indicadores, info = preparado
+        resultado = self.avaliar_indicadores(ticker, df_indicadores, info, forca_relativa, regras,
+                                             self.volume_medio_diario(ticker) if intervalo else None)
+        
+        # **Confirmação semanal/mensal a partir do histórico diário longo (1 ano teria só ~12 meses)**
+        # Mesma entrada de cache de onde o 1 ano foi fatiado: nenhuma busca extra
+        if resultado is not None and not intervalo:
+            df_longo, _ = self.obter_dados_acao(ticker, PERIODO_TIMEFRAMES)
+            resultado['multi_timeframe'] = self.avaliar_multi_timeframe(
+                df_longo if df_longo is not None else df, df_indicadores.iloc[-1]
+            )
+        
+        return resultado
+    
+    def avaliar_acao(self, ticker, intervalo=None, forca_relativa=None, regras=None):
+        """Avalia uma ação com estratégia completa (diário ou intraday)"""
+        preparado = self.preparar_acao(ticker, intervalo, regras.indicadores if regras else INDICADORES_SCORE)
+        if preparado is None:
+            return None
+        
+        criterios_regras = None
+        if regras:
+            df_indicadores, info = preparado[1], preparado[2]
+            linha = ConjuntoRegras.extrair_variaveis(df_indicadores, info, forca_relativa,
+                                                     self.volume_medio_diario(ticker) if intervalo else None)
+            criterios_regras = regras.avaliar([linha])[0]
+        return self.concluir_avaliacao(ticker, preparado, intervalo, forca_relativa, criterios_regras)
+    
+    def direcao_tecnica(self, ultimo):
+        """Direção (Alta/Baixa/Neutro) pelos critérios EMA, RSI e MACD ponderados"""
+        criterios = {
+            'tendencia_ema': self.criterio_tendencia_ema(ultimo)[0],
+            'rsi': self.criterio_rsi(ultimo)[0],
+            'macd': self.criterio_macd(ultimo)[0]
+        }
+        peso_total = sum(self.criterios_pesos[c] for c in criterios)
+        score = sum(valor * self.criterios_pesos[c] for c, valor in criterios.items()) / peso_total
+        
+        if score >= 0.2:
+            return score, "Alta"
+        elif score <= -0.2:
+            return score, "Baixa"
+        return score, "Neutro"
+    
+    def avaliar_multi_timeframe(self, df, ultimo_diario):
+        """Reamostra o diário em semanal/mensal e compara as direções (histórico já em cache)"""
+        agregacao = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
+        timeframes = {'Diário': self.direcao_tecnica(ultimo_diario)}
+        
+        for nome, regra in TIMEFRAMES_REAMOSTRAGEM.items():
+            barras = df[list(agregacao)].resample(regra).agg(agregacao).dropna(subset=['Close'])
+            if len(barras) < MIN_BARRAS_TIMEFRAME:
+                timeframes[nome] = (None, "Sem Dados")
+                continue
+            barras = self.calcular_indicadores(barras, INDICADORES_DIRECAO, barras=1)
+            timeframes[nome] = self.direcao_tecnica(barras.iloc[-1])
+        
+        direcoes = [direcao for _, direcao in timeframes.values() if direcao != "Sem Dados"]
+        if len(set(direcoes)) == 1:
+            alinhamento = f"✅ {direcoes[0]}" if direcoes[0] != "Neutro" else "⚖️ Neutro"
+        elif "Alta" in direcoes and "Baixa" in direcoes:
+            alinhamento = "❌ Divergente"
+        else:
+            alinhamento = "⚠️ Parcial"
+        
+        return {
+            'timeframes': {nome: {'score': score, 'direcao': direcao} for nome, (score, direcao) in timeframes.items()},
+            'alinhamento': alinhamento
+        }
+    
+    @staticmethod
+    def classificar_decisao(score_total):
+        """Decisão pelo score total (mesmos limiares do histórico vetorizado)"""
+        if score_total >= 0.6:
+            return "Forte Compra"
+        elif score_total >= 0.2:
+            return "Compra"
+        elif score_total <= -0.6:
+            return "Forte Venda"
+        elif score_total <= -0.2:
+            return "Venda"
+        return "Neutro"
     
-    def avaliar_acao(self, ticker):
-        """Avalia uma ação com estratégia completa"""
-        df, info = self.obter_dados_acao(ticker)
+    def calcular_score_tecnico_historico(self, df, volume_medio=None):
+        """Critérios técnicos (EMA, RSI, MACD, liquidez) em todas as barras de uma vez"""
+        preco = df['Close'].to_numpy(dtype='float64')
+        ema9, ema21, ema50 = (df[f'EMA_{p}'].to_numpy(dtype='float64') for p in (9, 21, 50))
+        rsi = df['RSI'].to_numpy(dtype='float64')
+        macd = df['MACD'].to_numpy(dtype='float64')
+        sinal = df['MACD_Signal'].to_numpy(dtype='float64')
+        histograma = df['MACD_Histogram'].to_numpy(dtype='float64')
+        # tail(20) na última barra equivale à média móvel de até 20 barras (no painel, já vem por ticker)
+        if volume_medio is None:
+            volume_medio = df['Volume'].rolling(20, min_periods=1).mean()
+        volume_medio = np.asarray(volume_medio, dtype='float64')
         
-        if df is None or info is None:
+        # Mesma ordem de prioridade dos critérios escalares; NaN (aquecimento) cai no neutro
+        criterios = pd.DataFrame({
+            'tendencia_ema': np.select(
+                [(preco > ema9) & (ema9 > ema21) & (ema21 > ema50), preco > ema21,
+                 (preco < ema9) & (ema9 < ema21) & (ema21 < ema50), preco < ema21],
+                [1.0, 0.5, -1.0, -0.5], 0.0),
+            'rsi': np.select(
+                [rsi < 30, rsi > 70, (rsi >= 30) & (rsi <= 45), (rsi >= 55) & (rsi <= 70)],
+                [1.0, -1.0, 0.5, -0.5], 0.0),
+            'macd': np.select(
+                [(macd > sinal) & (histograma > 0), (macd < sinal) & (histograma < 0)],
+                [1.0, -1.0], 0.0),
+            'liquidez': np.select(
+                [volume_medio >= 1000000, volume_medio >= 100000],
+                [0.5, 0.0], -0.5)
+        }, index=df.index)
+        
+        pesos = np.array([self.criterios_pesos[c] for c in criterios.columns])
+        criterios['score_tecnico'] = criterios.to_numpy() @ pesos
+        return criterios
+    
+    @staticmethod
+    def historico_decisoes(score_tecnico, score_constante=0.0):
+        """Score e decisão por barra; fundamentos, força relativa e regras entram com o valor atual (constante)"""
+        score = score_tecnico + score_constante
+        decisao = np.select(
+            [score >= 0.6, score >= 0.2, score <= -0.6, score <= -0.2],
+            ["Forte Compra", "Compra", "Forte Venda", "Venda"], "Neutro")
+        return pd.DataFrame({'score': score, 'decisao': decisao}, index=score_tecnico.index)
+    
+    @staticmethod
+    def dias_desde_mudanca(historico):
+        """Dias corridos desde a última troca de decisão no histórico (None sem troca)"""
+        decisoes = historico['decisao'].to_numpy()
+        mudancas = np.flatnonzero(decisoes[1:] != decisoes[:-1])
+        if not len(mudancas):
             return None
+        return int((historico.index[-1] - historico.index[mudancas[-1] + 1]).days)
+    
+    @staticmethod
+    def criterio_pe(pe_ratio):
+        """Score e sinal do P/E (faixa 8-18 favorável, acima de 30 desfavorável)"""
+        if not pe_ratio or pe_ratio <= 0:
+            return 0.0, "Sem Dados"
+        if 8 <= pe_ratio <= 18:
+            return 1.0, "Compra"
+        elif pe_ratio > 30:
+            return -1.0, "Venda"
+        return 0.0, "Neutro"
+    
+    @staticmethod
+    def criterio_roe(roe):
+        """Score e sinal do ROE (15% ou mais favorável, abaixo de 8% desfavorável)"""
+        if not roe or roe <= 0:
+            return 0.0, "Sem Dados"
+        roe_pct = roe * 100
+        if roe_pct >= 15:
+            return 1.0, "Compra"
+        elif roe_pct < 8:
+            return -1.0, "Venda"
+        return 0.0, "Neutro"
+    
+    @staticmethod
+    def criterio_forca_relativa(forca_relativa):
+        """Score e sinal do retorno relativo ao benchmark e do percentil no universo"""
+        if not forca_relativa:
+            return 0.0, "Sem Dados"
+        rs = forca_relativa['rs']
+        percentil = forca_relativa['percentil']
+        if rs > 0 and percentil >= 0.8:
+            return 1.0, "Forte Compra"
+        elif rs > 0:
+            return 0.5, "Compra"
+        elif rs < 0 and percentil <= 0.2:
+            return -1.0, "Forte Venda"
+        elif rs < 0:
+            return -0.5, "Venda"
+        return 0.0, "Neutro"
+    
+    @staticmethod
+    def criterio_tendencia_ema(ultimo):
+        """Score e sinal do alinhamento de preço com EMA 9/21/50"""
+        preco = ultimo['Close']
+        ema9 = ultimo.get('EMA_9', preco)
+        ema21 = ultimo.get('EMA_21', preco)
+        ema50 = ultimo.get('EMA_50', preco)
         
-        df = self.calcular_indicadores(df)
+        if preco > ema9 > ema21 > ema50:
+            return 1.0, "Forte Compra"
+        elif preco > ema21:
+            return 0.5, "Compra"
+        elif preco < ema9 < ema21 < ema50:
+            return -1.0, "Forte Venda"
+        elif preco < ema21:
+            return -0.5, "Venda"
+        return 0.0, "Neutro"
+    
+    @staticmethod
+    def criterio_rsi(ultimo):
+        """Score e sinal do RSI (sobrevenda/sobrecompra)"""
+        rsi = ultimo.get('RSI', 50)
+        if rsi < 30:
+            return 1.0, "Forte Compra"
+        elif rsi > 70:
+            return -1.0, "Forte Venda"
+        elif 30 <= rsi <= 45:
+            return 0.5, "Compra"
+        elif 55 <= rsi <= 70:
+            return -0.5, "Venda"
+        return 0.0, "Neutro"
+    
+    @staticmethod
+    def criterio_macd(ultimo):
+        """Score e sinal do cruzamento MACD x sinal"""
+        macd_line = ultimo.get('MACD', 0)
+        macd_signal = ultimo.get('MACD_Signal', 0)
+        macd_hist = ultimo.get('MACD_Histogram', 0)
+        
+        if macd_line > macd_signal and macd_hist > 0:
+            return 1.0, "Compra"
+        elif macd_line < macd_signal and macd_hist < 0:
+            return -1.0, "Venda"
+        return 0.0, "Neutro"
+    
+    def volume_medio_diario(self, ticker):
+        """Volume médio das últimas 20 barras diárias do cache (NaN sem dados)"""
+        df, _ = self.obter_dados_acao(ticker)
+        return df['Volume'].tail(20).mean() if df is not None else np.nan
+    
+    def avaliar_indicadores(self, ticker, df, info, forca_relativa=None, regras=None, volume_medio=None):
+        """Pontua um frame já com indicadores (última linha; liquidez pelo volume_medio diário ou pelas últimas 20 barras)"""
         ultimo = df.iloc[-1]
         
         # Inicializar resultado
@@ -735,25 +2318,7 @@ class ScreenerAvancado:
         
         # **1. Tendência EMA**
         preco = ultimo['Close']
-        ema9 = ultimo.get('EMA_9', preco)
-        ema21 = ultimo.get('EMA_21', preco)
-        ema50 = ultimo.get('EMA_50', preco)
-        
-        if preco > ema9 > ema21 > ema50:
-            ema_score = 1.0
-            ema_sinal = "Forte Compra"
-        elif preco > ema21:
-            ema_score = 0.5
-            ema_sinal = "Compra"
-        elif preco < ema9 < ema21 < ema50:
-            ema_score = -1.0
-            ema_sinal = "Forte Venda"
-        elif preco < ema21:
-            ema_score = -0.5
-            ema_sinal = "Venda"
-        else:
-            ema_score = 0.0
-            ema_sinal = "Neutro"
+        ema_score, ema_sinal = self.criterio_tendencia_ema(ultimo)
         
         score_total += ema_score * self.criterios_pesos['tendencia_ema']
         resultado['criterios']['tendencia_ema'] = {
@@ -764,21 +2329,7 @@ class ScreenerAvancado:
         
         # **2. RSI**
         rsi = ultimo.get('RSI', 50)
-        if rsi < 30:
-            rsi_score = 1.0
-            rsi_sinal = "Forte Compra"
-        elif rsi > 70:
-            rsi_score = -1.0
-            rsi_sinal = "Forte Venda"
-        elif 30 <= rsi <= 45:
-            rsi_score = 0.5
-            rsi_sinal = "Compra"
-        elif 55 <= rsi <= 70:
-            rsi_score = -0.5
-            rsi_sinal = "Venda"
-        else:
-            rsi_score = 0.0
-            rsi_sinal = "Neutro"
+        rsi_score, rsi_sinal = self.criterio_rsi(ultimo)
         
         score_total += rsi_score * self.criterios_pesos['rsi']
         resultado['criterios']['rsi'] = {
@@ -789,18 +2340,7 @@ class ScreenerAvancado:
         
         # **3. MACD**
         macd_line = ultimo.get('MACD', 0)
-        macd_signal = ultimo.get('MACD_Signal', 0)
-        macd_hist = ultimo.get('MACD_Histogram', 0)
-        
-        if macd_line > macd_signal and macd_hist > 0:
-            macd_score = 1.0
-            macd_sinal = "Compra"
-        elif macd_line < macd_signal and macd_hist < 0:
-            macd_score = -1.0
-            macd_sinal = "Venda"
-        else:
-            macd_score = 0.0
-            macd_sinal = "Neutro"
+        macd_score, macd_sinal = self.criterio_macd(ultimo)
         
         score_total += macd_score * self.criterios_pesos['macd']
         resultado['criterios']['macd'] = {
@@ -811,55 +2351,30 @@ class ScreenerAvancado:
         
         # **4. P/E Ratio**
         pe_ratio = info.get('trailingPE', None)
-        if pe_ratio and pe_ratio > 0:
-            if 8 <= pe_ratio <= 18:
-                pe_score = 1.0
-                pe_sinal = "Compra"
-            elif pe_ratio > 30:
-                pe_score = -1.0
-                pe_sinal = "Venda"
-            else:
-                pe_score = 0.0
-                pe_sinal = "Neutro"
-        else:
-            pe_score = 0.0
-            pe_sinal = "Sem Dados"
-            pe_ratio = "N/A"
+        pe_score, pe_sinal = self.criterio_pe(pe_ratio)
         
         score_total += pe_score * self.criterios_pesos['pe_ratio']
         resultado['criterios']['pe_ratio'] = {
             'sinal': pe_sinal,
             'score': pe_score,
-            'valor': f"{pe_ratio:.1f}" if pe_ratio != "N/A" else "N/A"
+            'valor': f"{pe_ratio:.1f}" if pe_ratio and pe_ratio > 0 else "N/A"
         }
         
         # **5. ROE**
         roe = info.get('returnOnEquity', None)
-        if roe and roe > 0:
-            roe_pct = roe * 100
-            if roe_pct >= 15:
-                roe_score = 1.0
-                roe_sinal = "Compra"
-            elif roe_pct < 8:
-                roe_score = -1.0
-                roe_sinal = "Venda"
-            else:
-                roe_score = 0.0
-                roe_sinal = "Neutro"
-        else:
-            roe_score = 0.0
-            roe_sinal = "Sem Dados"
-            roe_pct = "N/A"
+        roe_score, roe_sinal = self.criterio_roe(roe)
         
         score_total += roe_score * self.criterios_pesos['roe']
         resultado['criterios']['roe'] = {
             'sinal': roe_sinal,
             'score': roe_score,
-            'valor': f"{roe_pct:.1f}%" if roe_pct != "N/A" else "N/A"
+            'valor': f"{roe * 100:.1f}%" if roe and roe > 0 else "N/A"
         }
         
         # **6. Liquidez**
-        volume_medio = df['Volume'].tail(20).mean()
+        # Intraday: limiares são diários, então o volume médio vem do histórico diário
+        if volume_medio is None:
+            volume_medio = df['Volume'].tail(20).mean()
         if volume_medio >= 1000000:
             liq_score = 0.5
             liq_sinal = "Alta"
@@ -877,19 +2392,35 @@ class ScreenerAvancado:
             'valor': f"{volume_medio:,.0f}"
         }
         
+        # **7. Força Relativa vs. benchmark**
+        resultado['forca_relativa'] = forca_relativa
+        fr_score, fr_sinal = self.criterio_forca_relativa(forca_relativa)
+        if forca_relativa:
+            fr_valor = (f"{forca_relativa['rs'] * 100:+.1f}% vs {forca_relativa['benchmark']} "
+                        f"(P{forca_relativa['percentil'] * 100:.0f})")
+        else:
+            fr_valor = "N/A"
+        
+        score_total += fr_score * self.criterios_pesos['forca_relativa']
+        resultado['criterios']['forca_relativa'] = {
+            'sinal': fr_sinal,
+            'score': fr_score,
+            'valor': fr_valor
+        }
+        
+        # **8. Regras personalizadas (avaliadas em lote sobre o universo)**
+        for nome, regra in (regras or {}).items():
+            score_total += regra['score'] * regra['peso']
+            resultado['criterios'][nome] = {
+                'sinal': ("Compra" if regra['score'] > 0 else "Venda") if regra['ativa'] else "Neutro",
+                'score': regra['score'],
+                'peso': regra['peso'],
+                'valor': html.escape(regra['texto'])
+            }
+        
         # **Decisão final**
         resultado['score_total'] = score_total
-        
-        if score_total >= 0.6:
-            resultado['decisao'] = "Forte Compra"
-        elif score_total >= 0.2:
-            resultado['decisao'] = "Compra"
-        elif score_total <= -0.6:
-            resultado['decisao'] = "Forte Venda"
-        elif score_total <= -0.2:
-            resultado['decisao'] = "Venda"
-        else:
-            resultado['decisao'] = "Neutro"
+        resultado['decisao'] = self.classificar_decisao(score_total)
         
         # **Calcular estratégia automaticamente**
         estrategia = EstrategiaNegociacao.calcular_estrategia(df, resultado)
@@ -907,25 +2438,993 @@ class ScreenerAvancado:
         
         return resultado
     
-    def executar_screener(self, tickers):
-        """Executa screener com estratégias"""
+    def montar_painel_fechamentos(self, tickers):
+        """Painel Data x Ticker de fechamentos do cache (fusos reduzidos à data do pregão)"""
+        fechamentos = {}
+        for ticker in tickers:
+            df, _ = self.obter_dados_acao(ticker)
+            if df is not None:
+                close = df['Close']
+                indice = close.index.tz_localize(None) if close.index.tz is not None else close.index
+                fechamentos[ticker] = pd.Series(close.to_numpy(), index=indice.normalize())
+        
+        if not fechamentos:
+            return pd.DataFrame()
+        return pd.DataFrame(fechamentos).sort_index()
+    
+    def montar_painel_setups(self, tickers, periodo="2y", regras=None):
+        """Painel longo (ticker, data) de OHLCV do cache e parte não técnica do score atual por ticker"""
+        with ThreadPoolExecutor(max_workers=VALIDACAO_MAX_THREADS) as executor:
+            dados = list(executor.map(lambda t: self.obter_dados_acao(t, periodo), tickers))
+        forca_relativa = self.calcular_forca_relativa(tickers)
+        
+        partes, constante, carregados = [], {}, {}
+        for ticker, (df, info) in zip(tickers, dados):
+            if df is None or df.empty:
+                continue
+            indice = df.index.tz_localize(None) if df.index.tz is not None else df.index
+            partes.append(pd.DataFrame({
+                'ticker': ticker,
+                'data': indice.normalize(),
+                **{coluna: df[coluna].to_numpy(dtype='float64') for coluna in ('High', 'Low', 'Close', 'Volume')}
+            }))
+            info = info or {}
+            carregados[ticker] = (df, info)
+            constante[ticker] = (
+                self.criterio_pe(info.get('trailingPE'))[0] * self.criterios_pesos['pe_ratio']
+                + self.criterio_roe(info.get('returnOnEquity'))[0] * self.criterios_pesos['roe']
+                + self.criterio_forca_relativa(forca_relativa.get(ticker))[0] * self.criterios_pesos['forca_relativa']
+            )
+        
+        # Regras avaliadas na última barra, como no screener, e somadas como constante
+        if regras and carregados:
+            linhas = [ConjuntoRegras.extrair_variaveis(self.calcular_indicadores(df, regras.indicadores, barras=20),
+                                                       info, forca_relativa.get(ticker))
+                      for ticker, (df, info) in carregados.items()]
+            for ticker, criterios in zip(carregados, regras.avaliar(linhas)):
+                constante[ticker] += sum(c['score'] * c['peso'] for c in criterios.values())
+        
+        if not partes:
+            return pd.DataFrame(), constante
+        return pd.concat(partes, ignore_index=True), constante
+    
+    def calcular_indicadores_painel(self, painel):
+        """EMA 9/21/50, RSI, MACD, ATR e janelas de 20 barras por ticker no painel longo, sem laço por ticker"""
+        ticker = painel['ticker']
+        
+        # Mesmas fórmulas do ta, aplicadas por grupo (min_periods conta só as barras do próprio ticker)
+        def media_exponencial(serie, **parametros):
+            return serie.groupby(ticker, sort=False).ewm(adjust=False, **parametros).mean().droplevel(0)
+        
+        def janela_20(serie, funcao):
+            return getattr(serie.groupby(ticker, sort=False).rolling(20, min_periods=1), funcao)().droplevel(0)
+        
+        close = painel['Close']
+        novas = {f'EMA_{p}': media_exponencial(close, span=p, min_periods=p) for p in (9, 21, 50)}
+        
+        variacao = close.groupby(ticker, sort=False).diff()
+        media_alta = media_exponencial(variacao.where(variacao > 0, 0.0), alpha=1 / 14, min_periods=14)
+        media_baixa = media_exponencial(-variacao.where(variacao < 0, 0.0), alpha=1 / 14, min_periods=14)
+        novas['RSI'] = pd.Series(np.where(media_baixa == 0, 100, 100 - (100 / (1 + media_alta / media_baixa))),
+                                 index=media_baixa.index)
+        
+        macd = (media_exponencial(close, span=12, min_periods=12)
+                - media_exponencial(close, span=26, min_periods=26))
+        novas['MACD'] = macd
+        novas['MACD_Signal'] = media_exponencial(macd, span=9, min_periods=9)
+        novas['MACD_Histogram'] = macd - novas['MACD_Signal']
+        
+        # ATR de Wilder: semente = média simples das 14 primeiras faixas; antes dela, 0 como no ta
+        fechamento_anterior = close.groupby(ticker, sort=False).shift()
+        faixa = pd.concat([
+            painel['High'] - painel['Low'],
+            (painel['High'] - fechamento_anterior).abs(),
+            (painel['Low'] - fechamento_anterior).abs()
+        ], axis=1).max(axis=1)
+        posicao = ticker.groupby(ticker, sort=False).cumcount()
+        semente = faixa.groupby(ticker, sort=False).rolling(14).mean().droplevel(0)
+        faixa = faixa.where(posicao > 13, semente.where(posicao == 13))
+        novas['ATR'] = media_exponencial(faixa, alpha=1 / 14).fillna(0.0)
+        
+        novas['High_20'] = janela_20(painel['High'], 'max')
+        novas['Low_20'] = janela_20(painel['Low'], 'min')
+        novas['Volume_20'] = janela_20(painel['Volume'], 'mean')
+        return painel.assign(**novas)
+    
+    def escanear_setups(self, tickers, periodo="2y", regras=None):
+        """Todas as ocorrências históricas de cada setup nos tickers e a frequência por setup
+        
+        Só os critérios técnicos são recalculados barra a barra. P/E, ROE, força relativa e regras
+        entram com o valor atual em todas as barras passadas (viés de antecipação: o passado é
+        julgado com fundamentos que ainda não eram conhecidos).
+        """
+        painel, constante = self.montar_painel_setups(tickers, periodo, regras)
+        if painel.empty:
+            return pd.DataFrame(), pd.DataFrame()
+        
+        painel = self.calcular_indicadores_painel(painel)
+        criterios = self.calcular_score_tecnico_historico(painel, volume_medio=painel['Volume_20'])
+        decisoes = self.historico_decisoes(criterios['score_tecnico'], painel['ticker'].map(constante).to_numpy())
+        setups = EstrategiaNegociacao.classificar_setups(painel.assign(decisao=decisoes['decisao']))
+        
+        # Uma ocorrência por sequência: a barra em que o setup aparece; 'barras' = quanto ele durou
+        setup = setups['setup'].to_numpy()
+        ticker = painel['ticker'].to_numpy()
+        inicio = np.ones(len(setup), dtype=bool)
+        inicio[1:] = (setup[1:] != setup[:-1]) | (ticker[1:] != ticker[:-1])
+        sequencia = np.cumsum(inicio) - 1
+        duracao = np.bincount(sequencia)[sequencia]
+        mascara = inicio & (setup != "")
+        
+        ocorrencias = pd.concat([
+            painel.loc[mascara, ['ticker', 'data', 'Close']].rename(columns={'Close': 'preco'}),
+            decisoes.loc[mascara],
+            setups.loc[mascara]
+        ], axis=1).assign(barras=duracao[mascara]).reset_index(drop=True)
+        
+        # Anos de cada ticker pelo próprio calendário (cripto negocia 365 dias, bolsa ~252)
+        datas = painel.groupby('ticker', sort=False)['data'].agg(['min', 'max'])
+        ticker_anos = ((datas['max'] - datas['min']).dt.days / 365.25).sum()
+        estatisticas = ocorrencias.groupby('setup').agg(
+            ocorrencias=('ticker', 'size'),
+            tickers=('ticker', 'nunique'),
+            barras_media=('barras', 'mean'),
+            ultima=('data', 'max')
+        )
+        estatisticas = estatisticas.reindex([s for s in SETUPS_ESTRATEGIA if s in estatisticas.index])
+        estatisticas.insert(1, 'por_ticker_ano', estatisticas['ocorrencias'] / ticker_anos if ticker_anos > 0 else np.nan)
+        return ocorrencias, estatisticas.reset_index()
+    
+    def calcular_forca_relativa(self, tickers, janela=JANELA_FORCA_RELATIVA):
+        """Retorno relativo ao benchmark nas barras do próprio ticker e percentil no universo"""
+        # Futuros não têm benchmark e o próprio benchmark teria RS sempre 0: ambos ficam fora do percentil
+        mapa_benchmark = {t: BENCHMARKS.get(classificar_mercado(t)) for t in tickers}
+        mapa_benchmark = {t: b for t, b in mapa_benchmark.items() if b and b != t}
+        
+        fechamentos = {}
+        for ticker in set(mapa_benchmark) | set(mapa_benchmark.values()):
+            df, _ = self.obter_dados_acao(ticker)
+            if df is not None:
+                close = df['Close']
+                indice = close.index.tz_localize(None) if close.index.tz is not None else close.index
+                fechamentos[ticker] = pd.Series(close.to_numpy(), index=indice.normalize())
+        
+        ativos = [t for t, b in mapa_benchmark.items() if t in fechamentos and b in fechamentos]
+        if not ativos:
+            return {}
+        
+        # Painel Data x Ticker alinhado; janela de N barras do calendário de cada ticker (coluna a coluna)
+        painel = pd.DataFrame(fechamentos).sort_index()
+        precos = painel[ativos].to_numpy(dtype='float64')
+        valido = ~np.isnan(precos)
+        contagem = valido.cumsum(axis=0)
+        total = contagem[-1]
+        colunas = np.arange(len(ativos))
+        fim = len(precos) - 1 - np.argmax(valido[::-1], axis=0)
+        inicio = np.argmax(valido & (contagem == total - janela), axis=0)
+        
+        # Benchmark medido entre as mesmas datas (último fechamento até cada data, como asof)
+        referencias = painel[[mapa_benchmark[t] for t in ativos]].ffill().to_numpy(dtype='float64')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            retorno = precos[fim, colunas] / precos[inicio, colunas]
+            retorno_benchmark = referencias[fim, colunas] / referencias[inicio, colunas]
+            valores = retorno / retorno_benchmark - 1
+        valores[total <= janela] = np.nan
+        
+        rs = pd.Series(valores, index=ativos, dtype='float64').replace([np.inf, -np.inf], np.nan).dropna()
+        percentil = rs.rank(pct=True)
+        
+        return {
+            t: {
+                'rs': float(rs[t]),
+                'percentil': float(percentil[t]),
+                'benchmark': mapa_benchmark[t]
+            }
+            for t in rs.index
+        }
+
+    def aplicar_monte_carlo(self, resultados, simulador):
+        """Substitui a probabilidade heurística pela estimativa de Monte Carlo (todos os setups de uma vez)"""
+        setups, alvos = [], []
+        for resultado in resultados:
+            estrategia = resultado['estrategia']
+            if estrategia['tipo'] not in ('COMPRA', 'VENDA') or estrategia.get('entrada') is None:
+                continue
+            df, _ = self.obter_dados_acao(resultado['ticker'])
+            if df is None:
+                continue
+            retornos = np.log(df['Close']).diff().dropna().to_numpy()[-252:]
+            if len(retornos) < 20:
+                continue
+            setups.append({
+                **estrategia,
+                'ticker': resultado['ticker'],
+                'retornos': retornos,
+                'volatilidade': resultado['gestao_risco']['volatilidade_pct'] / 100
+            })
+            alvos.append(estrategia)
+
+        prob_1, prob_2 = simulador.estimar(setups)
+        for estrategia, p1, p2 in zip(alvos, prob_1, prob_2):
+            estrategia['probabilidade'] = int(round(p2))
+            estrategia['prob_alvo_1'] = float(p1)
+            estrategia['prob_alvo_2'] = float(p2)
+            estrategia['metodo_probabilidade'] = 'Monte Carlo'
+        return resultados
+
+    def executar_screener(self, tickers, intervalo=None, simulador=None, regras=None, progresso=True):
+        """Executa screener com estratégias (progresso=False fora de uma sessão, ex.: API)"""
         resultados = []
+        inicio = time.perf_counter()
+
+        # Resultados diários recentes de outro processo para o mesmo universo e parâmetros
+        compartilhado = None if intervalo else obter_cache_compartilhado()
+        if compartilhado:
+            parametros = json.dumps([sorted(tickers), self.criterios_pesos, vars(simulador) if simulador else None,
+                                     [r.texto for r in regras.regras] if regras else None],
+                                    sort_keys=True)
+            chave_resultados = (hashlib.sha256(parametros.encode('utf-8')).hexdigest()[:32],)
+            anteriores = compartilhado.obter_json('resultados', chave_resultados)
+            if anteriores is not None:
+                return anteriores
+
+        progress_bar = st.progress(0) if progresso else _ProgressoNulo()
+        status_text = st.empty() if progresso else _ProgressoNulo()
+        
+        for i, ticker in enumerate(tickers):
+            status_text.text(f"🔍 Carregando {ticker} ({i+1}/{len(tickers)})...")
+            progress_bar.progress((i + 1) / len(tickers))
+            if not intervalo:
+                self.obter_dados_acao(ticker, PERIODO_TIMEFRAMES)
         
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+        # Força relativa do universo inteiro em uma passada (benchmarks buscados uma vez)
+        status_text.text("📐 Calculando força relativa...")
+        forca_relativa = {} if intervalo else self.calcular_forca_relativa(tickers)
         
+        indicadores = regras.indicadores if regras else INDICADORES_SCORE
+        preparados = {}
         for i, ticker in enumerate(tickers):
             status_text.text(f"🔍 Analisando {ticker} ({i+1}/{len(tickers)})...")
-            progress_bar.progress((i + 1) / len(tickers))
-            
-            resultado = self.avaliar_acao(ticker)
+            preparado = self.preparar_acao(ticker, intervalo, indicadores)
+            if preparado is not None:
+                preparados[ticker] = preparado
+        
+        # Regras personalizadas: uma avaliação vetorizada por regra sobre a tabela do universo
+        criterios_regras = {}
+        if regras and preparados:
+            linhas = [ConjuntoRegras.extrair_variaveis(df_ind, info, forca_relativa.get(ticker),
+                                                       self.volume_medio_diario(ticker) if intervalo else None)
+                      for ticker, (_, df_ind, info) in preparados.items()]
+            criterios_regras = dict(zip(preparados, regras.avaliar(linhas)))
+        
+        for ticker, preparado in preparados.items():
+            resultado = self.concluir_avaliacao(ticker, preparado, intervalo, forca_relativa.get(ticker),
+                                                criterios_regras.get(ticker))
             if resultado:
                 resultados.append(resultado)
-        
+
+        # Monte Carlo usa retornos diários; no intraday mantém a heurística
+        if simulador and not intervalo:
+            status_text.text("🎲 Simulando probabilidades...")
+            self.aplicar_monte_carlo(resultados, simulador)
+
         progress_bar.empty()
         status_text.empty()
-        
-        return sorted(resultados, key=lambda x: x['score_total'], reverse=True)
+
+        metricas.observar('screener_run_duration_seconds', time.perf_counter() - inicio,
+                          BUCKETS_DURACAO, ajuda='Duração de cada execução do screener')
+        metricas.observar('screener_run_tickers', len(tickers), BUCKETS_TICKERS,
+                          ajuda='Quantidade de tickers por execução')
+        if METRICAS_ARQUIVO:
+            try:
+                metricas.exportar_arquivo(METRICAS_ARQUIVO)
+            except OSError:
+                # Falha ao exportar métricas não descarta uma execução já concluída
+                metricas.incrementar('screener_metrics_export_errors_total',
+                                     ajuda='Falhas ao gravar o arquivo de métricas')
+
+        resultados = sorted(resultados, key=lambda x: x['score_total'], reverse=True)
+        if compartilhado:
+            compartilhado.guardar_json('resultados', chave_resultados, resultados, RESULTADOS_TTL)
+        return resultados
+
+# **Diversificação - correlação de retornos no painel do cache**
+JANELA_CORRELACAO = 126
+
+def calcular_matriz_correlacao(painel, janela=JANELA_CORRELACAO):
+    """Correlação dos retornos diários via covariância matricial (numpy)"""
+    retornos = np.log(painel.ffill()).diff().iloc[-janela:]
+    valores = retornos.to_numpy(dtype='float64')
+
+    # Retornos ausentes viram a média da coluna (contribuição nula na covariância)
+    medias = np.nanmean(valores, axis=0)
+    centrados = np.nan_to_num(valores - medias)
+    covariancia = centrados.T @ centrados / max(len(centrados) - 1, 1)
+
+    desvios = np.sqrt(np.diag(covariancia))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlacao = covariancia / np.outer(desvios, desvios)
+    return pd.DataFrame(np.nan_to_num(correlacao), index=painel.columns, columns=painel.columns)
+
+def selecionar_diversificados(tickers_ordenados, correlacao, limite=0.7, quantidade=10):
+    """Seleção gulosa: percorre por score e aceita apenas quem respeita a correlação máxima"""
+    disponiveis = [t for t in tickers_ordenados if t in correlacao.index]
+    matriz = correlacao.loc[disponiveis, disponiveis].to_numpy()
+    posicoes = {t: i for i, t in enumerate(disponiveis)}
+
+    # Maior correlação de cada candidato com os já selecionados
+    correlacao_max = np.full(len(disponiveis), -np.inf)
+    par_mais_correlacionado = np.full(len(disponiveis), -1)
+    selecionados, excluidos = [], {}
+
+    for ticker in disponiveis:
+        i = posicoes[ticker]
+        if correlacao_max[i] > limite:
+            excluidos[ticker] = (disponiveis[par_mais_correlacionado[i]], float(correlacao_max[i]))
+            continue
+
+        selecionados.append(ticker)
+        if len(selecionados) == quantidade:
+            break
+
+        maior = matriz[i] > correlacao_max
+        correlacao_max = np.where(maior, matriz[i], correlacao_max)
+        par_mais_correlacionado = np.where(maior, i, par_mais_correlacionado)
+
+    return selecionados, excluidos
+
+# **Carteira - dimensionamento de posições por orçamento de risco**
+LOTES_MERCADO = {'SA': 100, 'US': 1, 'USD': 0.0001, 'F': 1}
+# Moeda de cotação por mercado e par de câmbio para a moeda base da carteira (R$)
+MOEDA_MERCADO = {'SA': 'BRL', 'US': 'USD', 'USD': 'USD', 'F': 'USD'}
+TICKERS_CAMBIO = {'USD': 'BRL=X'}
+
+def obter_cambio(screener, tickers):
+    """Cotação em R$ de cada moeda presente nos tickers (NaN se o câmbio não estiver disponível)"""
+    cambio = {'BRL': 1.0}
+    for moeda in {MOEDA_MERCADO[classificar_mercado(t)] for t in tickers} - {'BRL'}:
+        df, _ = screener.obter_dados_acao(TICKERS_CAMBIO[moeda])
+        cambio[moeda] = float(df['Close'].iloc[-1]) if df is not None and not df.empty else np.nan
+    return cambio
+
+def dimensionar_posicoes(resultados, capital, risco_pct=2.0, heat_max_pct=10.0,
+                         max_posicao_pct=25.0, fracionario_b3=False, cambio=None):
+    """Dimensiona todas as posições acionáveis de uma vez em R$ (câmbio por moeda); retorna (tabela, resumo)"""
+    acionaveis = [
+        r for r in resultados
+        if r['estrategia']['tipo'] in ('COMPRA', 'VENDA')
+        and r['estrategia'].get('entrada') is not None
+        and r['estrategia'].get('stop_loss') is not None
+    ]
+    resumo = {'capital': capital, 'alocado': 0.0, 'risco_total': 0.0, 'heat_pct': 0.0, 'posicoes': 0}
+    if not acionaveis or capital <= 0:
+        return pd.DataFrame(), resumo
+
+    tickers = np.array([r['ticker'] for r in acionaveis])
+    moedas = [MOEDA_MERCADO[classificar_mercado(t)] for t in tickers]
+    # Sem câmbio a posição fica zerada em vez de somar dólares como reais
+    fator = np.array([(cambio or {'BRL': 1.0}).get(m, np.nan) for m in moedas], dtype='float64')
+    entrada = np.array([r['estrategia']['entrada'] for r in acionaveis], dtype='float64')
+    stop = np.array([r['estrategia']['stop_loss'] for r in acionaveis], dtype='float64')
+    lote = np.array([
+        1 if fracionario_b3 and classificar_mercado(t) == 'SA' else LOTES_MERCADO[classificar_mercado(t)]
+        for t in tickers
+    ], dtype='float64')
+
+    # Risco por unidade (em R$) e quantidade pelo risco por trade, limitada pelo peso máximo
+    risco_unitario = np.abs(entrada - stop) * fator
+    with np.errstate(divide='ignore', invalid='ignore'):
+        quantidade = np.minimum(
+            capital * risco_pct / 100 / risco_unitario,
+            capital * max_posicao_pct / 100 / (entrada * fator)
+        )
+    quantidade = np.nan_to_num(quantidade, nan=0.0, posinf=0.0)
+
+    # Heat total acima do orçamento: reduz todas as posições na mesma proporção
+    risco = quantidade * risco_unitario
+    orcamento = capital * heat_max_pct / 100
+    if risco.sum() > orcamento:
+        quantidade *= orcamento / risco.sum()
+
+    # Exposição total acima do capital: mesma redução proporcional
+    exposicao = (quantidade * entrada * fator).sum()
+    if exposicao > capital:
+        quantidade *= capital / exposicao
+
+    quantidade = np.round(np.floor(quantidade / lote + 1e-9) * lote, 8)
+    valor = quantidade * entrada * fator
+    risco = quantidade * risco_unitario
+
+    tabela = pd.DataFrame({
+        'Ticker': tickers,
+        'Tipo': [r['estrategia']['tipo'] for r in acionaveis],
+        'Decisão': [r['decisao'] for r in acionaveis],
+        'Moeda': moedas,
+        'Câmbio': fator,
+        'Entrada': entrada,
+        'Stop Loss': stop,
+        'Lote': lote,
+        'Quantidade': quantidade,
+        'Valor Posição R$': valor,
+        'Peso %': valor / capital * 100,
+        'Risco R$': risco,
+        'Risco %': risco / capital * 100,
+        'Volatilidade %': [r['gestao_risco']['volatilidade_pct'] for r in acionaveis]
+    })
+    tabela = tabela[tabela['Quantidade'] > 0].reset_index(drop=True)
+
+    resumo.update({
+        'alocado': float(tabela['Valor Posição R$'].sum()),
+        'risco_total': float(tabela['Risco R$'].sum()),
+        'heat_pct': float(tabela['Risco R$'].sum() / capital * 100),
+        'posicoes': len(tabela)
+    })
+    return tabela, resumo
+
+# **Histórico de execuções - Parquet particionado por data; dias encerrados são compactados**
+LOCK_COMPACTACAO_EXPIRA = 600  # segundos até um lock de compactação abandonado ser descartado
+ESQUEMA_HISTORICO = pa.schema([
+    ('execucao', pa.string()),
+    ('instante', pa.timestamp('ms', tz='UTC')),
+    ('categoria', pa.string()),
+    ('intervalo', pa.string()),
+    ('parametros', pa.string()),
+    ('ticker', pa.string()),
+    ('score', pa.float64()),
+    ('decisao', pa.string()),
+    ('criterios', pa.map_(pa.string(), pa.float64())),
+    ('preco', pa.float64()),
+    ('tipo', pa.string()),
+    ('setup', pa.string()),
+    ('entrada', pa.float64()),
+    ('stop_loss', pa.float64()),
+    ('alvo_1', pa.float64()),
+    ('alvo_2', pa.float64())
+])
+
+def hash_parametros(parametros):
+    """Identificador curto e estável de um conjunto de parâmetros de análise"""
+    texto = json.dumps(parametros, sort_keys=True, default=_json_padrao)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()[:16]
+
+class HistoricoExecucoes:
+    """Cada execução vira um arquivo em data=AAAA-MM-DD/; dias anteriores são reescritos em um só"""
+
+    def __init__(self, diretorio="historico_execucoes"):
+        self.diretorio = diretorio
+        self._particoes = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, resultados, categoria, parametros, intervalo=None):
+        """Grava os resultados de uma execução em arquivo próprio; retorna o id da execução"""
+        if not resultados:
+            return None
+        agora = pd.Timestamp.now(tz='UTC')
+        execucao = f"{agora.strftime('%Y%m%dT%H%M%S%f')}-{os.getpid()}"
+
+        def nivel(r, campo):
+            valor = r['estrategia'].get(campo)
+            return float(valor) if valor is not None else None
+
+        colunas = {
+            'execucao': [execucao] * len(resultados),
+            'instante': [agora] * len(resultados),
+            'categoria': [categoria] * len(resultados),
+            'intervalo': [intervalo or '1d'] * len(resultados),
+            'parametros': [hash_parametros(parametros)] * len(resultados),
+            'ticker': [r['ticker'] for r in resultados],
+            'score': [float(r['score_total']) for r in resultados],
+            'decisao': [r['decisao'] for r in resultados],
+            'criterios': [[(c, float(d['score'])) for c, d in r['criterios'].items()] for r in resultados],
+            'preco': [float(r['preco']) for r in resultados],
+            'tipo': [r['estrategia']['tipo'] for r in resultados],
+            'setup': [r['estrategia'].get('setup') for r in resultados],
+            'entrada': [nivel(r, 'entrada') for r in resultados],
+            'stop_loss': [nivel(r, 'stop_loss') for r in resultados],
+            'alvo_1': [nivel(r, 'alvo_1') for r in resultados],
+            'alvo_2': [nivel(r, 'alvo_2') for r in resultados]
+        }
+        particao = os.path.join(self.diretorio, f"data={agora.date().isoformat()}")
+        os.makedirs(particao, exist_ok=True)
+
+        # Grava em arquivo oculto e renomeia: leitores nunca veem um Parquet pela metade
+        self._gravar(pa.table(colunas, schema=ESQUEMA_HISTORICO), particao, f"{execucao}.parquet")
+
+        self.compactar(antes_de=agora.date().isoformat())
+        return execucao
+
+    @staticmethod
+    def _gravar(tabela, particao, nome):
+        # Prefixo '.' é ignorado pela descoberta do dataset até o rename atômico (pid evita colisão)
+        temporario = os.path.join(particao, f".{nome}.{os.getpid()}.{threading.get_ident()}.tmp")
+        pq.write_table(tabela, temporario, compression='zstd')
+        os.replace(temporario, os.path.join(particao, nome))
+
+    @contextmanager
+    def _lock_compactacao(self):
+        """Lock entre processos (arquivo criado com O_EXCL); entrega False se outro processo o detém"""
+        caminho = os.path.join(self.diretorio, '.compactacao.lock')
+        try:
+            if time.time() - os.path.getmtime(caminho) > LOCK_COMPACTACAO_EXPIRA:
+                os.remove(caminho)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(caminho, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            os.remove(caminho)
+
+    def compactar(self, antes_de):
+        """Reescreve os arquivos de cada dia anterior a `antes_de` em um único Parquet ordenado"""
+        if not os.path.isdir(self.diretorio):
+            return
+        with self._lock_compactacao() as dono:
+            # Só um processo compacta por vez; os demais seguem e a partição fica para o dono do lock
+            if not dono:
+                return
+            for nome in sorted(os.listdir(self.diretorio)):
+                if not nome.startswith('data=') or nome[5:] >= antes_de:
+                    continue
+                particao = os.path.join(self.diretorio, nome)
+                arquivos = sorted(f for f in os.listdir(particao) if f.endswith('.parquet'))
+                if len(arquivos) <= 1:
+                    continue
+                tabela = pa.concat_tables(
+                    [pq.read_table(os.path.join(particao, f), schema=ESQUEMA_HISTORICO) for f in arquivos]
+                ).sort_by([('ticker', 'ascending'), ('instante', 'ascending')])
+                self._gravar(tabela, particao, 'compactado.parquet')
+                for f in arquivos:
+                    if f != 'compactado.parquet':
+                        os.remove(os.path.join(particao, f))
+
+    def _tabela_particao(self, nome):
+        """Tabela de um dia, relida só quando a lista de arquivos da partição muda"""
+        particao = os.path.join(self.diretorio, nome)
+        for tentativa in range(3):
+            arquivos = tuple(sorted(f for f in os.listdir(particao) if f.endswith('.parquet')))
+            with self._lock:
+                em_cache = self._particoes.get(nome)
+            if em_cache is not None and em_cache[0] == arquivos:
+                return em_cache[1]
+            try:
+                tabela = ds.dataset([os.path.join(particao, f) for f in arquivos], format='parquet',
+                                    schema=ESQUEMA_HISTORICO).to_table()
+                break
+            except OSError:
+                # Compactação de outro processo removeu arquivos entre a listagem e a leitura
+                if tentativa == 2:
+                    raise
+        with self._lock:
+            self._particoes[nome] = (arquivos, tabela)
+        return tabela
+
+    def consultar(self, inicio=None, fim=None, tickers=None, intervalo='1d', colunas=None):
+        """Linhas do período (datas ISO inclusivas); poda por partição e filtra em Arrow"""
+        colunas = colunas or ESQUEMA_HISTORICO.names
+        if not os.path.isdir(self.diretorio):
+            return pd.DataFrame(columns=colunas)
+
+        nomes = sorted(
+            nome for nome in os.listdir(self.diretorio)
+            if nome.startswith('data=')
+            and (not inicio or nome[5:] >= inicio)
+            and (not fim or nome[5:] <= fim)
+        )
+        if not nomes:
+            return pd.DataFrame(columns=colunas)
+
+        # Projeta antes de filtrar: só as colunas pedidas passam pela máscara
+        selecao = list(dict.fromkeys(['instante', 'intervalo', 'ticker', *colunas]))
+        tabela = pa.concat_tables([self._tabela_particao(nome).select(selecao) for nome in nomes])
+        mascara = pc.equal(tabela['intervalo'], intervalo or '1d')
+        if tickers:
+            mascara = pc.and_(mascara, pc.is_in(tabela['ticker'], value_set=pa.array(list(tickers))))
+
+        tabela = tabela.filter(mascara)
+        df = tabela.to_pandas().sort_values('instante', kind='stable').reset_index(drop=True)
+        return df[colunas]
+
+    def tempo_na_decisao(self, ticker, inicio=None):
+        """Decisão atual do ticker e desde quando ela se mantém sem interrupção"""
+        df = self.consultar(inicio=inicio, tickers=[ticker], colunas=['instante', 'decisao'])
+        if df.empty:
+            return None
+
+        decisoes = df['decisao'].to_numpy()
+        mudancas = np.flatnonzero(decisoes[1:] != decisoes[:-1])
+        primeira = mudancas[-1] + 1 if len(mudancas) else 0
+        return {
+            'decisao': decisoes[-1],
+            'desde': df['instante'].iloc[primeira],
+            'execucoes': int(len(df) - primeira),
+            'ultima': df['instante'].iloc[-1]
+        }
+
+    def mudancas_decisao(self, inicio, fim=None, tickers=None):
+        """Toda troca de decisão entre execuções consecutivas do mesmo ticker no período"""
+        df = self.consultar(inicio=inicio, fim=fim, tickers=tickers,
+                            colunas=['instante', 'categoria', 'ticker', 'decisao', 'score'])
+        if df.empty:
+            return df
+
+        df = df.sort_values(['ticker', 'instante'], kind='stable')
+        anterior = df.groupby('ticker')['decisao'].shift()
+        mudou = anterior.notna() & (anterior != df['decisao'])
+        return df.assign(decisao_anterior=anterior)[mudou].sort_values('instante', ascending=False)
+
+@st.cache_resource(show_spinner=False)
+def obter_historico_execucoes():
+    """Histórico de execuções único por processo"""
+    return HistoricoExecucoes()
+
+# **Monitoramento ao vivo - atualização incremental da última barra**
+class IndicadoresIncrementais:
+    """Recalcula EMA/RSI/MACD/ATR/Bollinger da última barra a partir do estado da barra anterior"""
+
+    PERIODOS_EMA = (9, 12, 21, 26, 50, 200)
+
+    def __init__(self, df):
+        self.cauda = df.tail(20).copy()
+        self.base = self._estado(df, -2)
+        self.barras = len(df)
+
+    @staticmethod
+    def _estado(df, posicao):
+        """Estado recursivo (mesmas fórmulas da biblioteca ta) na barra indicada"""
+        close = df['Close']
+        diff = close.diff(1)
+
+        estado = {
+            f'EMA_{p}': close.ewm(span=p, adjust=False).mean().iloc[posicao]
+            for p in IndicadoresIncrementais.PERIODOS_EMA
+        }
+        estado['MACD_Signal'] = df['MACD_Signal'].iloc[posicao]
+        estado['ganho'] = diff.where(diff > 0, 0.0).ewm(alpha=1 / 14, adjust=False).mean().iloc[posicao]
+        estado['perda'] = (-diff.where(diff < 0, 0.0)).ewm(alpha=1 / 14, adjust=False).mean().iloc[posicao]
+        estado['ATR'] = df['ATR'].iloc[posicao]
+        estado['Close'] = close.iloc[posicao]
+        return estado
+
+    @staticmethod
+    def _avancar(estado, barra):
+        """Aplica uma barra ao estado; retorna (novo estado, indicadores da barra)"""
+        fechamento = barra['Close']
+        novo = {}
+
+        for p in IndicadoresIncrementais.PERIODOS_EMA:
+            anterior = estado[f'EMA_{p}']
+            novo[f'EMA_{p}'] = anterior + 2 / (p + 1) * (fechamento - anterior)
+
+        macd = novo['EMA_12'] - novo['EMA_26']
+        novo['MACD_Signal'] = estado['MACD_Signal'] + 2 / 10 * (macd - estado['MACD_Signal'])
+
+        diff = fechamento - estado['Close']
+        novo['ganho'] = estado['ganho'] + (max(diff, 0.0) - estado['ganho']) / 14
+        novo['perda'] = estado['perda'] + (max(-diff, 0.0) - estado['perda']) / 14
+
+        true_range = max(
+            barra['High'] - barra['Low'],
+            abs(barra['High'] - estado['Close']),
+            abs(barra['Low'] - estado['Close'])
+        )
+        novo['ATR'] = (estado['ATR'] * 13 + true_range) / 14
+        novo['Close'] = fechamento
+
+        indicadores = {f'EMA_{p}': novo[f'EMA_{p}'] for p in (9, 21, 50, 200)}
+        indicadores.update({
+            'RSI': 100.0 if novo['perda'] == 0 else 100 - 100 / (1 + novo['ganho'] / novo['perda']),
+            'MACD': macd,
+            'MACD_Signal': novo['MACD_Signal'],
+            'MACD_Histogram': macd - novo['MACD_Signal'],
+            'ATR': novo['ATR']
+        })
+        return novo, indicadores
+
+    def atualizar(self, data, barra):
+        """Atualiza a barra em formação ou abre uma nova; retorna as últimas 20 barras"""
+        ultima_data = self.cauda.index[-1]
+        if data < ultima_data:
+            return self.cauda
+
+        if data > ultima_data:
+            # A barra anterior se consolida e vira a nova base
+            self.base, _ = self._avancar(self.base, self.cauda.iloc[-1])
+            nova_linha = pd.DataFrame([self.cauda.iloc[-1]], index=[data])
+            self.cauda = pd.concat([self.cauda.iloc[1:], nova_linha])
+            self.barras += 1
+
+        _, indicadores = self._avancar(self.base, barra)
+        for coluna in ('Open', 'High', 'Low', 'Close', 'Volume'):
+            self.cauda.iloc[-1, self.cauda.columns.get_loc(coluna)] = barra[coluna]
+
+        # Como no ta, EMA sem barras suficientes fica NaN (min_periods = período)
+        for p in (9, 21, 50, 200):
+            if self.barras < p:
+                indicadores[f'EMA_{p}'] = np.nan
+
+        # Bollinger 20: a janela é a própria cauda, já com o fechamento da barra atual (desvio populacional)
+        fechamentos = self.cauda['Close'].to_numpy(dtype='float64')
+        media = fechamentos.mean() if len(fechamentos) >= 20 else np.nan
+        desvio = fechamentos.std() if len(fechamentos) >= 20 else np.nan
+        indicadores.update({'BB_Middle': media, 'BB_Upper': media + 2 * desvio, 'BB_Lower': media - 2 * desvio})
+
+        for coluna, valor in indicadores.items():
+            if coluna in self.cauda.columns:
+                self.cauda.iloc[-1, self.cauda.columns.get_loc(coluna)] = valor
+        return self.cauda
+
+def obter_ultimas_barras(tickers):
+    """Busca em paralelo apenas a barra diária mais recente de cada ticker"""
+    requisicoes = obter_requisicoes_unicas()
+
+    def ultima_barra(ticker):
+        try:
+            hist = requisicoes.executar(
+                (ticker, '1d', 'ultima_barra'),
+                lambda: yf.Ticker(ticker).history(period="1d", auto_adjust=True, timeout=10)
+            )
+            return None if hist.empty else (hist.index[-1], hist.iloc[-1])
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=VALIDACAO_MAX_THREADS) as executor:
+        return dict(zip(tickers, executor.map(ultima_barra, tickers)))
+
+def atualizar_monitoramento(screener, resultados, estados, intervalo=None, simulador=None, regras=None):
+    """Reavalia os tickers monitorados; retorna (resultados reordenados, mudanças de decisão)"""
+    tickers = [r['ticker'] for r in resultados]
+    anteriores = {r['ticker']: r for r in resultados}
+    novos = []
+
+    if intervalo:
+        # Intraday: o buffer circular já busca apenas as barras novas
+        for ticker in tickers:
+            novos.append(screener.avaliar_acao(ticker, intervalo, regras=regras) or anteriores[ticker])
+    else:
+        barras = obter_ultimas_barras(tickers)
+        caudas = {}
+        for ticker in tickers:
+            if ticker not in estados:
+                df, info = screener.obter_dados_acao(ticker)
+                if df is None:
+                    continue
+                estados[ticker] = (IndicadoresIncrementais(screener.calcular_indicadores(df)), info)
+
+            incremental, info = estados[ticker]
+            if barras.get(ticker) is not None:
+                data, barra = barras[ticker]
+                caudas[ticker] = (incremental.atualizar(data, barra), info)
+
+        criterios_regras = {}
+        if regras and caudas:
+            linhas = [ConjuntoRegras.extrair_variaveis(cauda, info, anteriores[ticker].get('forca_relativa'))
+                      for ticker, (cauda, info) in caudas.items()]
+            criterios_regras = dict(zip(caudas, regras.avaliar(linhas)))
+
+        for ticker in tickers:
+            if ticker not in caudas:
+                novos.append(anteriores[ticker])
+                continue
+
+            cauda, info = caudas[ticker]
+            novo = screener.avaliar_indicadores(ticker, cauda, info, anteriores[ticker].get('forca_relativa'),
+                                                criterios_regras.get(ticker))
+            if 'multi_timeframe' in anteriores[ticker]:
+                novo['multi_timeframe'] = anteriores[ticker]['multi_timeframe']
+            novos.append(novo)
+        if simulador:
+            screener.aplicar_monte_carlo(novos, simulador)
+
+    mudancas = {
+        r['ticker']: (anteriores[r['ticker']]['decisao'], r['decisao'])
+        for r in novos if r['decisao'] != anteriores[r['ticker']]['decisao']
+    }
+    novos.sort(key=lambda x: x['score_total'], reverse=True)
+    return novos, mudancas
+
+# **Motor de Alertas - diff entre execuções e regras por linha alterada**
+ALERTAS_ARQUIVO = os.environ.get('SCREENER_ALERTS_FILE')
+ALERTAS_WEBHOOK = os.environ.get('SCREENER_ALERTS_WEBHOOK')
+
+def resumir_resultado(resultado):
+    """Snapshot compacto de um resultado, usado no diff entre execuções"""
+    estrategia = resultado['estrategia']
+    return {
+        'ticker': resultado['ticker'],
+        'decisao': resultado['decisao'],
+        'preco': float(resultado['preco']),
+        'score': round(float(resultado['score_total']), 4),
+        'tipo': estrategia['tipo'],
+        'entrada': estrategia.get('entrada'),
+        'stop_loss': estrategia.get('stop_loss')
+    }
+
+def _regra_decisao(regra, anterior, atual):
+    alvo = regra.get('decisao', 'Forte Compra')
+    if atual['decisao'] == alvo and (anterior is None or anterior['decisao'] != alvo):
+        return f"{atual['ticker']} entrou em {alvo} (score {atual['score']:.2f})"
+    return None
+
+def _regra_cruzou_entrada(regra, anterior, atual):
+    if anterior is None or anterior.get('entrada') is None:
+        return None
+    entrada = anterior['entrada']
+    if anterior['tipo'] == 'COMPRA' and anterior['preco'] < entrada <= atual['preco']:
+        return f"{atual['ticker']} rompeu a entrada de compra em {entrada:.2f}"
+    if anterior['tipo'] == 'VENDA' and anterior['preco'] > entrada >= atual['preco']:
+        return f"{atual['ticker']} perdeu a entrada de venda em {entrada:.2f}"
+    return None
+
+def _regra_atingiu_stop(regra, anterior, atual):
+    if anterior is None or anterior.get('stop_loss') is None:
+        return None
+    stop = anterior['stop_loss']
+    if anterior['tipo'] == 'COMPRA' and atual['preco'] <= stop < anterior['preco']:
+        return f"{atual['ticker']} atingiu o stop de compra em {stop:.2f}"
+    if anterior['tipo'] == 'VENDA' and atual['preco'] >= stop > anterior['preco']:
+        return f"{atual['ticker']} atingiu o stop de venda em {stop:.2f}"
+    return None
+
+def _regra_score_acima(regra, anterior, atual):
+    limite = regra.get('limite', 0.6)
+    if atual['score'] >= limite and (anterior is None or anterior['score'] < limite):
+        return f"{atual['ticker']} com score {atual['score']:.2f} acima de {limite:.2f}"
+    return None
+
+REGRAS_ALERTA = {
+    'decisao': ("Entrou na decisão", _regra_decisao),
+    'cruzou_entrada': ("Cruzou o nível de entrada", _regra_cruzou_entrada),
+    'atingiu_stop': ("Atingiu o stop loss", _regra_atingiu_stop),
+    'score_acima': ("Score acima do limite", _regra_score_acima)
+}
+
+class SinkArquivo:
+    """Anexa alertas em arquivo JSON Lines"""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+
+    def enviar(self, alertas):
+        with open(self.caminho, 'a', encoding='utf-8') as f:
+            for alerta in alertas:
+                f.write(json.dumps(alerta, ensure_ascii=False) + '\n')
+
+class SinkWebhook:
+    """Envia alertas via POST JSON (ex.: stub local) em worker próprio, sem bloquear a interface"""
+
+    def __init__(self, url, timeout=2, tamanho_fila=100):
+        self.url = url
+        self.timeout = timeout
+        self._fila = queue.Queue(maxsize=tamanho_fila)
+        threading.Thread(target=self._trabalhar, daemon=True, name="alertas-webhook").start()
+
+    def enviar(self, alertas):
+        """Enfileira o lote; com a fila cheia (endpoint parado) o lote é descartado"""
+        try:
+            self._fila.put_nowait(alertas)
+        except queue.Full:
+            metricas.incrementar('screener_alert_webhook_errors_total',
+                                 ajuda='Lotes de alertas não entregues ao webhook', reason='fila_cheia')
+
+    def _postar(self, alertas):
+        corpo = json.dumps({'alertas': alertas}, ensure_ascii=False).encode('utf-8')
+        requisicao = urllib.request.Request(
+            self.url, data=corpo, headers={'Content-Type': 'application/json'}, method='POST'
+        )
+        with urllib.request.urlopen(requisicao, timeout=self.timeout):
+            pass
+
+    def _trabalhar(self):
+        while True:
+            alertas = self._fila.get()
+            try:
+                self._postar(alertas)
+            except Exception:
+                metricas.incrementar('screener_alert_webhook_errors_total',
+                                     ajuda='Lotes de alertas não entregues ao webhook', reason='falha')
+
+@st.cache_resource(show_spinner=False)
+def obter_sink_webhook(url):
+    """Um worker de webhook por processo, compartilhado pelos motores de todas as sessões"""
+    return SinkWebhook(url)
+
+class MotorAlertas:
+    """Compara snapshots por ticker e avalia as regras apenas nas linhas alteradas"""
+
+    def __init__(self, regras=None, sinks=None, janela_dedup=3600, max_por_minuto=20, tamanho_feed=200):
+        self.regras = regras or [{'tipo': 'decisao', 'decisao': 'Forte Compra'}]
+        self.sinks = sinks or []
+        self.janela_dedup = janela_dedup
+        self.max_por_minuto = max_por_minuto
+        self.snapshot = {}
+        self.feed = deque(maxlen=tamanho_feed)
+        self.duplicados = 0
+        self.limitados = 0
+        self._emitidos = {}
+        self._envios = deque()
+
+    @property
+    def suprimidos(self):
+        """Total de alertas retidos (de-duplicação + limite por minuto)"""
+        return self.duplicados + self.limitados
+
+    def diff(self, atual):
+        """Pares (anterior, atual) dos tickers novos ou com algum campo alterado"""
+        return [
+            (self.snapshot.get(ticker), linha)
+            for ticker, linha in atual.items()
+            if self.snapshot.get(ticker) != linha
+        ]
+
+    def _liberar(self, alerta, agora):
+        """Aplica de-duplicação por (ticker, regra) e limite de alertas por minuto"""
+        chave = (alerta['ticker'], alerta['regra'])
+        if agora - self._emitidos.get(chave, float('-inf')) < self.janela_dedup:
+            self.duplicados += 1
+            return False
+
+        while self._envios and agora - self._envios[0] > 60:
+            self._envios.popleft()
+        if len(self._envios) >= self.max_por_minuto:
+            self.limitados += 1
+            return False
+
+        self._emitidos[chave] = agora
+        self._envios.append(agora)
+        return True
+
+    def processar(self, resultados):
+        """Gera, filtra e envia os alertas da nova execução; retorna os emitidos"""
+        atual = {r['ticker']: resumir_resultado(r) for r in resultados}
+        agora = time.time()
+        candidatos = []
+
+        for anterior, linha in self.diff(atual):
+            for regra in self.regras:
+                _, funcao = REGRAS_ALERTA[regra['tipo']]
+                mensagem = funcao(regra, anterior, linha)
+                if mensagem:
+                    candidatos.append({
+                        'ticker': linha['ticker'],
+                        'regra': regra['tipo'],
+                        'mensagem': mensagem,
+                        'decisao': linha['decisao'],
+                        'preco': linha['preco'],
+                        'data': datetime.fromtimestamp(agora).isoformat(timespec='seconds')
+                    })
+
+        self.snapshot = atual
+        duplicados, limitados = self.duplicados, self.limitados
+        emitidos = [a for a in candidatos if self._liberar(a, agora)]
+        for status, quantidade in (('emitido', len(emitidos)),
+                                   ('duplicado', self.duplicados - duplicados),
+                                   ('limitado', self.limitados - limitados)):
+            metricas.incrementar('screener_alerts_total', quantidade,
+                                 ajuda='Alertas gerados pelo motor de alertas', status=status)
+
+        if emitidos:
+            self.feed.extendleft(emitidos)
+            for sink in self.sinks:
+                try:
+                    sink.enviar(emitidos)
+                except Exception:
+                    pass
+
+        return emitidos
+
+def criar_motor_alertas():
+    """Motor com os sinks configurados por variável de ambiente"""
+    sinks = []
+    if ALERTAS_ARQUIVO:
+        sinks.append(SinkArquivo(ALERTAS_ARQUIVO))
+    if ALERTAS_WEBHOOK:
+        sinks.append(obter_sink_webhook(ALERTAS_WEBHOOK))
+    return MotorAlertas(sinks=sinks)
 
 def criar_card_oportunidade(resultado):
     """Cria card individual com correção de renderização HTML"""
@@ -949,7 +3448,12 @@ def criar_card_oportunidade(resultado):
         'VENDA': '📉',
         'AGUARDAR': '⏸️'
     }.get(estrategia['tipo'], '⚖️')
-    
+
+    # Monte Carlo: probabilidade do alvo 2 no selo, alvo 1 como complemento
+    rotulo_probabilidade = ''
+    if estrategia.get('metodo_probabilidade') == 'Monte Carlo':
+        rotulo_probabilidade = f" (MC · alvo 1: {estrategia['prob_alvo_1']:.0f}%)"
+
     # **CORREÇÃO: HTML sem indentação para evitar interpretação como código**
     card_html = f"""
 <div class="opportunity-card">
@@ -969,7 +3473,7 @@ def criar_card_oportunidade(resultado):
 <h4 style="color: #3b82f6; margin-bottom: 1rem; display: flex; align-items: center; gap: 0.5rem;">
 {emoji_tipo} {estrategia['setup']}
 <span style="background: linear-gradient(135deg, #10b981, #34d399); color: white; padding: 0.3rem 0.8rem; border-radius: 15px; font-size: 0.8rem; margin-left: auto;">
-{estrategia.get('probabilidade', 50)}% sucesso
+{estrategia.get('probabilidade', 50)}% sucesso{rotulo_probabilidade}
 </span>
 </h4>
 
@@ -1087,6 +3591,162 @@ def criar_card_oportunidade(resultado):
     # **CORREÇÃO: Usar textwrap.dedent para remover indentação**
     return textwrap.dedent(card_html)
 
+def criar_tabela_resultados(resultados, mudancas=None, dias_decisao=None):
+    """Monta tabela compacta (uma linha por ativo) para exibição virtualizada"""
+    mudancas = mudancas or {}
+    dias_decisao = dias_decisao or {}
+    linhas = []
+    for r in resultados:
+        estrategia = r['estrategia']
+        timeframes = (r.get('multi_timeframe') or {}).get('timeframes', {})
+        linhas.append({
+            'Ticker': r['ticker'],
+            'Decisão': r['decisao'],
+            'Mudança': '🔔 ' + ' → '.join(mudancas[r['ticker']]) if r['ticker'] in mudancas else '',
+            'Dias na Decisão': dias_decisao.get(r['ticker']),
+            'Score': r['score_total'],
+            'Preço': r['preco'],
+            'Entrada': estrategia.get('entrada'),
+            'Stop Loss': estrategia.get('stop_loss'),
+            'Alvo': estrategia.get('alvo_2'),
+            'R/R': estrategia.get('risco_retorno', 0),
+            'Volatilidade %': r['gestao_risco']['volatilidade_pct'],
+            'Semanal': timeframes.get('Semanal', {}).get('direcao', ''),
+            'Mensal': timeframes.get('Mensal', {}).get('direcao', ''),
+            'Alinhamento': (r.get('multi_timeframe') or {}).get('alinhamento', '')
+        })
+
+    return pd.DataFrame(linhas, columns=[
+        'Ticker', 'Decisão', 'Mudança', 'Dias na Decisão', 'Score', 'Preço', 'Entrada', 'Stop Loss', 'Alvo', 'R/R', 'Volatilidade %',
+        'Semanal', 'Mensal', 'Alinhamento'
+    ])
+
+CONFIG_COLUNAS_RESULTADOS = {
+    'Dias na Decisão': st.column_config.NumberColumn(
+        format="%d",
+        help="Dias desde a última troca de decisão no score por barra (1 ano); "
+             "fundamentos, força relativa e regras com o valor atual"
+    ),
+    'Score': st.column_config.NumberColumn(format="%.2f"),
+    'Preço': st.column_config.NumberColumn(format="%.2f"),
+    'Entrada': st.column_config.NumberColumn(format="%.2f"),
+    'Stop Loss': st.column_config.NumberColumn(format="%.2f"),
+    'Alvo': st.column_config.NumberColumn(format="%.2f"),
+    'R/R': st.column_config.NumberColumn(format="%.1f"),
+    'Volatilidade %': st.column_config.NumberColumn(format="%.2f")
+}
+
+# **Exportação (gerada apenas quando o download é solicitado)**
+def montar_tabela_export(resultados):
+    """Tabela completa da execução, incluindo score e sinal de cada critério"""
+    linhas = []
+    for r in resultados:
+        estrategia = r['estrategia']
+        linha = {
+            'Ticker': r['ticker'],
+            'Nome': r['nome'],
+            'Preço': r['preco'],
+            'Score': r['score_total'],
+            'Decisão': r['decisao'],
+            'Setup': estrategia['setup'],
+            'Entrada': estrategia.get('entrada'),
+            'Stop Loss': estrategia.get('stop_loss'),
+            'Alvo': estrategia.get('alvo_2'),
+            'R/R': estrategia.get('risco_retorno', 0),
+            'Probabilidade': estrategia.get('probabilidade', 50),
+            'Alinhamento': (r.get('multi_timeframe') or {}).get('alinhamento')
+        }
+        for criterio, dados in r['criterios'].items():
+            linha[f'Score {criterio}'] = dados['score']
+            linha[f'Sinal {criterio}'] = dados['sinal']
+        linhas.append(linha)
+
+    return pd.DataFrame(linhas)
+
+def montar_painel_indicadores(screener, tickers, periodo="1y"):
+    """Painel longo (Data x Ticker) com OHLCV e indicadores a partir do cache"""
+    frames = []
+    for ticker in tickers:
+        df, _ = screener.obter_dados_acao(ticker, periodo)
+        if df is None:
+            continue
+
+        df = screener.calcular_indicadores(df)
+        if df.index.tz is not None:
+            df.index = df.index.tz_localize(None)
+
+        df = df.rename_axis('Data').reset_index()
+        df.insert(0, 'Ticker', ticker)
+        frames.append(df)
+
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def montar_tabela_arrow(resultados, screener=None, incluir_painel=False):
+    """Tabela Arrow da execução, opcionalmente expandida com o painel de indicadores"""
+    tabela = montar_tabela_export(resultados)
+    if incluir_painel and screener is not None:
+        painel = montar_painel_indicadores(screener, tabela['Ticker'].tolist())
+        if not painel.empty:
+            tabela = painel.merge(tabela, on='Ticker', how='left')
+    return pa.Table.from_pandas(tabela, preserve_index=False)
+
+def exportar_parquet(resultados, screener=None, incluir_painel=False):
+    """Serializa a execução em Parquet (compressão zstd)"""
+    buffer = io.BytesIO()
+    pq.write_table(montar_tabela_arrow(resultados, screener, incluir_painel), buffer, compression='zstd')
+    return buffer.getvalue()
+
+def exportar_arrow_ipc(resultados, screener=None, incluir_painel=False):
+    """Serializa a execução no formato Arrow IPC (arquivo Feather v2)"""
+    tabela = montar_tabela_arrow(resultados, screener, incluir_painel)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, tabela.schema) as writer:
+        writer.write_table(tabela)
+    return sink.getvalue().to_pybytes()
+
+def gerar_csv_stream(df, linhas_por_bloco=1000):
+    """Gera o CSV em blocos de linhas, com cabeçalho apenas no primeiro"""
+    if df.empty:
+        yield df.to_csv(index=False)
+        return
+    for inicio in range(0, len(df), linhas_por_bloco):
+        yield df.iloc[inicio:inicio + linhas_por_bloco].to_csv(index=False, header=(inicio == 0))
+
+def exportar_csv(resultados, apenas_decisao=None):
+    """Monta o CSV bloco a bloco em bytes (download_button não aceita arquivos temporários)"""
+    df = montar_tabela_export(resultados)
+    if apenas_decisao:
+        df = df[df['Decisão'] == apenas_decisao]
+
+    return b"".join(bloco.encode('utf-8') for bloco in gerar_csv_stream(df))
+
+def gerar_relatorio_texto(resultados):
+    """Relatório resumido em texto da execução"""
+    forte_compra = len([r for r in resultados if r['decisao'] == 'Forte Compra'])
+    rr_values = [r['estrategia'].get('risco_retorno', 0) for r in resultados if r['estrategia'].get('risco_retorno', 0) > 0]
+    rr_medio = np.mean(rr_values) if rr_values else 0
+    prob_media = np.mean([r['estrategia'].get('probabilidade', 50) for r in resultados]) if resultados else 0
+
+    return f"""
+SCREENER PRO BR v2.1.3 - RELATÓRIO CORRIGIDO
+Data: {datetime.now().strftime('%d/%m/%Y %H:%M')}
+
+CORREÇÕES IMPLEMENTADAS:
+✅ HTML renderizado corretamente
+✅ Sem reset da tela ao selecionar ativo
+✅ Tratamento robusto de valores NaN
+✅ Verificações matemáticas de segurança
+
+RESUMO:
+- Analisados: {len(resultados)}
+- Forte Compra: {forte_compra}
+- R/R médio: 1:{rr_medio:.1f}
+- Probabilidade média: {prob_media:.0f}%
+
+TOP 5:
+{chr(10).join([f"{i+1}. {r['ticker']} - {r['decisao']} (R/R: 1:{r['estrategia'].get('risco_retorno', 0):.1f})" for i, r in enumerate(resultados[:5])])}
+                """
+
 def formatar_sinal_html_avancado(decisao):
     """Formata sinais com design avançado"""
     classes = {
@@ -1110,8 +3770,59 @@ def formatar_sinal_html_avancado(decisao):
     
     return f'<div class="{classe}">{emoji} {decisao}</div>'
 
-def criar_grafico_profissional(ticker, df):
-    """Cria gráfico técnico profissional com tema escuro"""
+# **Renderização de gráficos**
+PONTOS_MAX_GRAFICO = 1500
+
+def reduzir_pontos(df, max_pontos=PONTOS_MAX_GRAFICO):
+    """Agrupa barras consecutivas preservando máximas e mínimas (OHLC)"""
+    n = len(df)
+    if n <= max_pontos:
+        return df
+
+    tamanho = math.ceil(n / max_pontos)
+    grupos = np.arange(n) // tamanho
+
+    agregacao = {col: 'last' for col in df.columns}
+    agregacao.update({
+        col: regra for col, regra in {
+            'Open': 'first',
+            'High': 'max',
+            'Low': 'min',
+            'Close': 'last',
+            'Volume': 'sum',
+            'BB_Upper': 'max',
+            'BB_Lower': 'min'
+        }.items() if col in df.columns
+    })
+
+    reduzido = df.groupby(grupos).agg(agregacao)
+    reduzido.index = df.index[::tamanho]
+    return reduzido
+
+def reduzir_serie_minmax(serie, max_pontos=PONTOS_MAX_GRAFICO):
+    """Reduz uma série mantendo o mínimo e o máximo de cada bloco"""
+    n = len(serie)
+    if n <= max_pontos:
+        return serie.index, serie.to_numpy()
+
+    tamanho = math.ceil(n / (max_pontos // 2))
+    blocos = math.ceil(n / tamanho)
+    valores = np.full(blocos * tamanho, np.nan)
+    valores[:n] = serie.to_numpy(dtype=float)
+    matriz = valores.reshape(blocos, tamanho)
+
+    pos_min = np.where(np.isnan(matriz), np.inf, matriz).argmin(axis=1)
+    pos_max = np.where(np.isnan(matriz), -np.inf, matriz).argmax(axis=1)
+    base = np.arange(blocos) * tamanho
+    posicoes = np.sort(np.stack([base + pos_min, base + pos_max], axis=1), axis=1).ravel()
+    posicoes = np.unique(np.minimum(posicoes, n - 1))
+
+    return serie.index[posicoes], serie.to_numpy()[posicoes]
+
+def criar_grafico_profissional(ticker, df, max_pontos=PONTOS_MAX_GRAFICO):
+    """Cria gráfico técnico profissional com tema escuro (WebGL e downsampling)"""
+    df_barras = reduzir_pontos(df, max_pontos)
+
     fig = make_subplots(
         rows=4, cols=1,
         shared_xaxes=True,
@@ -1128,11 +3839,11 @@ def criar_grafico_profissional(ticker, df):
     # Candlestick
     fig.add_trace(
         go.Candlestick(
-            x=df.index,
-            open=df['Open'],
-            high=df['High'],
-            low=df['Low'],
-            close=df['Close'],
+            x=df_barras.index,
+            open=df_barras['Open'],
+            high=df_barras['High'],
+            low=df_barras['Low'],
+            close=df_barras['Close'],
             name='Preço',
             increasing_line_color='#10b981',
             decreasing_line_color='#ef4444',
@@ -1142,12 +3853,12 @@ def criar_grafico_profissional(ticker, df):
         row=1, col=1
     )
     
-    # Bollinger Bands
-    if 'BB_Upper' in df.columns:
+    # Bollinger Bands (mesmo eixo x das barras para o preenchimento alinhar)
+    if 'BB_Upper' in df_barras.columns:
         fig.add_trace(
-            go.Scatter(
-                x=df.index,
-                y=df['BB_Upper'],
+            go.Scattergl(
+                x=df_barras.index,
+                y=df_barras['BB_Upper'],
                 mode='lines',
                 name='BB Superior',
                 line=dict(color='#8b5cf6', width=1, dash='dash'),
@@ -1157,9 +3868,9 @@ def criar_grafico_profissional(ticker, df):
         )
         
         fig.add_trace(
-            go.Scatter(
-                x=df.index,
-                y=df['BB_Lower'],
+            go.Scattergl(
+                x=df_barras.index,
+                y=df_barras['BB_Lower'],
                 mode='lines',
                 name='BB Inferior',
                 line=dict(color='#8b5cf6', width=1, dash='dash'),
@@ -1180,10 +3891,11 @@ def criar_grafico_profissional(ticker, df):
     
     for periodo, cor, largura in ema_config:
         if f'EMA_{periodo}' in df.columns:
+            x, y = reduzir_serie_minmax(df[f'EMA_{periodo}'], max_pontos)
             fig.add_trace(
-                go.Scatter(
-                    x=df.index,
-                    y=df[f'EMA_{periodo}'],
+                go.Scattergl(
+                    x=x,
+                    y=y,
                     mode='lines',
                     name=f'EMA {periodo}',
                     line=dict(color=cor, width=largura),
@@ -1193,10 +3905,11 @@ def criar_grafico_profissional(ticker, df):
             )
     
     # RSI
+    x, y = reduzir_serie_minmax(df['RSI'], max_pontos)
     fig.add_trace(
-        go.Scatter(
-            x=df.index,
-            y=df['RSI'],
+        go.Scattergl(
+            x=x,
+            y=y,
             mode='lines',
             name='RSI',
             line=dict(color='#06b6d4', width=2)
@@ -1209,10 +3922,11 @@ def criar_grafico_profissional(ticker, df):
     fig.add_hline(y=50, line_dash="dot", line_color="#6b7280", opacity=0.5, row=2, col=1)
     
     # MACD
+    x, y = reduzir_serie_minmax(df['MACD'], max_pontos)
     fig.add_trace(
-        go.Scatter(
-            x=df.index,
-            y=df['MACD'],
+        go.Scattergl(
+            x=x,
+            y=y,
             mode='lines',
             name='MACD',
             line=dict(color='#3b82f6', width=2)
@@ -1220,10 +3934,11 @@ def criar_grafico_profissional(ticker, df):
         row=3, col=1
     )
     
+    x, y = reduzir_serie_minmax(df['MACD_Signal'], max_pontos)
     fig.add_trace(
-        go.Scatter(
-            x=df.index,
-            y=df['MACD_Signal'],
+        go.Scattergl(
+            x=x,
+            y=y,
             mode='lines',
             name='Signal',
             line=dict(color='#ef4444', width=2)
@@ -1232,11 +3947,11 @@ def criar_grafico_profissional(ticker, df):
     )
     
     # Histograma MACD
-    colors = ['#10b981' if x >= 0 else '#ef4444' for x in df['MACD_Histogram']]
+    colors = np.where(df_barras['MACD_Histogram'].to_numpy() >= 0, '#10b981', '#ef4444')
     fig.add_trace(
         go.Bar(
-            x=df.index,
-            y=df['MACD_Histogram'],
+            x=df_barras.index,
+            y=df_barras['MACD_Histogram'],
             name='Histogram',
             marker_color=colors,
             opacity=0.7
@@ -1245,13 +3960,14 @@ def criar_grafico_profissional(ticker, df):
     )
     
     # Volume
-    volume_colors = ['#10b981' if df['Close'].iloc[i] >= df['Open'].iloc[i] else '#ef4444' 
-                     for i in range(len(df))]
+    volume_colors = np.where(
+        df_barras['Close'].to_numpy() >= df_barras['Open'].to_numpy(), '#10b981', '#ef4444'
+    )
     
     fig.add_trace(
         go.Bar(
-            x=df.index,
-            y=df['Volume'],
+            x=df_barras.index,
+            y=df_barras['Volume'],
             name='Volume',
             marker_color=volume_colors,
             opacity=0.8
@@ -1277,6 +3993,225 @@ def criar_grafico_profissional(ticker, df):
     
     return fig
 
+# **API JSON local - categorias, resultados e séries de indicadores**
+API_PORTA = os.environ.get('SCREENER_API_PORT')
+# Períodos aceitos em /api/indicadores: todos servidos pela mesma entrada de 5 anos do cache
+PERIODOS_API = (*JANELAS_PERIODO, PERIODO_TIMEFRAMES)
+
+class ArmazemResultadosApi:
+    """Últimos resultados por categoria, com o instante em que cada linha mudou pela última vez"""
+
+    def __init__(self, gerenciador, screener, ttl=RESULTADOS_TTL):
+        self.gerenciador = gerenciador
+        self.screener = screener
+        self.ttl = ttl
+        self._categorias = {}
+        self._lock = threading.Lock()
+
+    def _calcular(self, categoria):
+        """Roda o pipeline do ScreenerAvancado e preserva o carimbo das linhas que não mudaram"""
+        tickers = self.gerenciador.obter_tickers_categoria(categoria)
+        regras = ConjuntoRegras(self.gerenciador.obter_regras(categoria), ignorar_invalidas=True)
+        resultados = self.screener.executar_screener(tickers, regras=regras or None, progresso=False)
+
+        agora = time.time()
+        with self._lock:
+            anterior = self._categorias.get(categoria, {}).get('linhas', {})
+        linhas = {}
+        for resultado in resultados:
+            corpo = json.loads(json.dumps(resultado, default=_json_padrao))
+            antiga = anterior.get(resultado['ticker'])
+            atualizado = antiga[0] if antiga and antiga[1] == corpo else agora
+            linhas[resultado['ticker']] = (atualizado, corpo)
+
+        estado = {'calculado': agora, 'linhas': linhas}
+        with self._lock:
+            self._categorias[categoria] = estado
+        return estado
+
+    def obter(self, categoria):
+        """Estado da categoria, recalculado (em voo único) quando passa do TTL"""
+        with self._lock:
+            estado = self._categorias.get(categoria)
+        if estado is None or time.time() - estado['calculado'] > self.ttl:
+            estado = obter_requisicoes_unicas().executar(
+                (categoria, None, 'resultados_api'), lambda: self._calcular(categoria)
+            )
+        return estado
+
+def _ler_since(valor):
+    """since= como epoch em segundos ou data/hora ISO; retorna epoch (None se ausente)"""
+    if not valor:
+        return None
+    try:
+        return float(valor)
+    except ValueError:
+        instante = pd.Timestamp(valor)
+        if instante.tzinfo is None:
+            instante = instante.tz_localize('UTC')
+        return instante.timestamp()
+
+def _json_finito(obj):
+    """NaN e ±inf viram null (JSON válido para qualquer cliente), em dicts, listas e escalares numpy"""
+    if isinstance(obj, dict):
+        return {chave: _json_finito(valor) for chave, valor in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_json_finito(valor) for valor in obj]
+    if isinstance(obj, (float, np.floating)):
+        return float(obj) if math.isfinite(obj) else None
+    return obj
+
+def _respostas_api(armazem, gerenciador, screener, caminho, consulta):
+    """Roteia GET /api/...; retorna (status, corpo JSON)"""
+    partes = [p for p in caminho.split('/') if p][1:]
+    since = _ler_since(consulta.get('since', [None])[0])
+
+    if partes == ['categorias']:
+        return 200, [
+            {'id': cat, **gerenciador.obter_info_categoria(cat)}
+            for cat in gerenciador.obter_categorias()
+        ]
+
+    if len(partes) == 2 and partes[0] == 'resultados':
+        categoria = partes[1]
+        if categoria not in gerenciador.obter_categorias():
+            return 404, {'erro': f"categoria '{categoria}' não encontrada"}
+        estado = armazem.obter(categoria)
+        linhas = sorted(estado['linhas'].values(), key=lambda l: l[1]['score_total'], reverse=True)
+        return 200, {
+            'categoria': categoria,
+            'atualizado_em': max((atualizado for atualizado, _ in linhas), default=None),
+            'tickers': [corpo['ticker'] for _, corpo in linhas],
+            'resultados': [
+                {**corpo, 'atualizado_em': atualizado}
+                for atualizado, corpo in linhas if since is None or atualizado > since
+            ]
+        }
+
+    if len(partes) == 2 and partes[0] == 'indicadores':
+        ticker = partes[1].upper()
+        periodo = consulta.get('periodo', ['1y'])[0]
+        if periodo not in PERIODOS_API:
+            return 400, {'erro': f"periodo inválido '{periodo}' (aceitos: {', '.join(PERIODOS_API)})"}
+        df, _ = screener.obter_dados_acao(ticker, periodo)
+        if df is None:
+            return 404, {'erro': f"sem dados para '{ticker}'"}
+        df = screener.calcular_indicadores(df)
+        if since is not None:
+            limite = pd.Timestamp(since, unit='s', tz='UTC')
+            df = df[df.index > (limite if df.index.tz is not None else limite.tz_localize(None))]
+        serie = df.reset_index(names='Data')
+        serie['Data'] = serie['Data'].map(lambda d: d.isoformat())
+        return 200, {
+            'ticker': ticker,
+            'periodo': periodo,
+            'colunas': list(serie.columns),
+            'linhas': serie.astype(object).where(serie.notna(), None).to_numpy().tolist()
+        }
+
+    return 404, {'erro': 'rota não encontrada'}
+
+def iniciar_servidor_api(gerenciador, screener, porta):
+    """Servidor HTTP em thread daemon com ETag/If-None-Match em todas as rotas"""
+    armazem = ArmazemResultadosApi(gerenciador, screener)
+
+    class _HandlerApi(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            if not url.path.startswith('/api/'):
+                self.send_error(404)
+                return
+            try:
+                status, dados = _respostas_api(armazem, gerenciador, screener, url.path,
+                                               urllib.parse.parse_qs(url.query))
+            except ValueError as erro:
+                status, dados = 400, {'erro': str(erro)}
+            except Exception as erro:
+                status, dados = 500, {'erro': str(erro)}
+
+            corpo = json.dumps(_json_finito(dados), default=_json_padrao, ensure_ascii=False,
+                               allow_nan=False).encode('utf-8')
+            etag = '"' + hashlib.sha256(corpo).hexdigest()[:32] + '"'
+            if status == 200 and self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', int(porta)), _HandlerApi)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+@st.cache_resource(show_spinner=False)
+def obter_servidor_api():
+    """Servidor da API único por processo (None sem SCREENER_API_PORT ou com a porta ocupada)"""
+    if not API_PORTA:
+        return None
+    try:
+        return iniciar_servidor_api(GerenciadorAtivos(), ScreenerAvancado(), API_PORTA)
+    except OSError:
+        return None
+
+COLUNAS_SCORE_TECNICO = ['tendencia_ema', 'rsi', 'macd', 'liquidez', 'score_tecnico']
+
+def obter_indicadores_cache(ticker, periodo, ultima_barra, screener, df):
+    """Indicadores e critérios técnicos por barra, guardados juntos no orçamento do cache de preços"""
+    cache = obter_cache_precos()
+    chave = (ticker, periodo, 'indicadores', ultima_barra)
+    encontrado, completo, _ = cache.obter(chave)
+    if not encontrado:
+        indicadores = screener.calcular_indicadores(df)
+        completo = cache.guardar(
+            chave, indicadores.join(screener.calcular_score_tecnico_historico(indicadores)), None, compactar=False
+        )
+    return completo.drop(columns=COLUNAS_SCORE_TECNICO), completo[COLUNAS_SCORE_TECNICO]
+
+def score_constante(screener, resultado):
+    """Contribuição atual de P/E, ROE, força relativa e regras ao score (constante no histórico por barra)"""
+    criterios = resultado['criterios']
+    return (
+        sum(criterios[c]['score'] * screener.criterios_pesos[c] for c in ('pe_ratio', 'roe', 'forca_relativa'))
+        + sum(c['score'] * c['peso'] for nome, c in criterios.items() if nome.startswith('regra_'))
+    )
+
+def obter_historico_score(screener, resultado):
+    """Score e decisão por barra no histórico diário de 1 ano de um resultado (None sem dados)"""
+    df, _ = screener.obter_dados_acao(resultado['ticker'])
+    if df is None:
+        return None
+    _, criterios = obter_indicadores_cache(
+        resultado['ticker'], "1y", (df.index[-1], float(df['Close'].iloc[-1])), screener, df
+    )
+    return screener.historico_decisoes(criterios['score_tecnico'], score_constante(screener, resultado))
+
+def calcular_dias_decisao(screener, resultados):
+    """Dias corridos na decisão atual de cada resultado, pelo histórico diário de score"""
+    dias_decisao = {}
+    for r in resultados:
+        historico_score = obter_historico_score(screener, r)
+        if historico_score is not None:
+            dias_decisao[r['ticker']] = screener.dias_desde_mudanca(historico_score)
+    return dias_decisao
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def obter_grafico_cache(ticker, periodo, ultima_barra, _screener, _df):
+    """Gráfico com indicadores cacheado por ticker, período e última barra (data, fechamento)"""
+    df, _ = obter_indicadores_cache(ticker, periodo, ultima_barra, _screener, _df)
+    return criar_grafico_profissional(ticker, df)
+
+# Executar inicialização
+init_session_state()
+
 def main():
     """Função principal da aplicação corrigida"""
     
@@ -1288,9 +4223,15 @@ def main():
     </div>
     """, unsafe_allow_html=True)
     
+    # Registrar sessão ativa nas métricas
+    sessao_id = obter_id_sessao()
+    if sessao_id:
+        metricas.registrar_sessao(sessao_id)
+
     # Inicializar gerenciadores
     gerenciador_ativos = GerenciadorAtivos()
     screener = ScreenerAvancado()
+    obter_servidor_api()
     
     # Menu principal
     selected = option_menu(
@@ -1372,6 +4313,66 @@ def main():
             with col2:
                 max_pe = st.number_input("P/E máx.:", value=30, step=5)
                 apenas_compra = st.checkbox("Apenas sinais de compra")
+
+            # Alertas
+            with st.expander("🔔 Alertas"):
+                tipos_alerta = st.multiselect(
+                    "Regras ativas:",
+                    options=list(REGRAS_ALERTA),
+                    default=['decisao', 'cruzou_entrada', 'atingiu_stop'],
+                    format_func=lambda tipo: REGRAS_ALERTA[tipo][0],
+                    key="alertas_regras"
+                )
+                decisao_alerta = st.selectbox(
+                    "Decisão monitorada:",
+                    options=["Forte Compra", "Compra", "Venda", "Forte Venda"],
+                    key="alertas_decisao"
+                )
+                limite_alerta = st.slider("Limite de score:", -1.0, 1.0, 0.6, 0.05, key="alertas_limite")
+
+            st.session_state.motor_alertas.regras = [
+                {'tipo': tipo, 'decisao': decisao_alerta, 'limite': limite_alerta}
+                for tipo in tipos_alerta
+            ]
+
+            # Periodicidade
+            modo_intraday = st.checkbox("⏱️ Modo intraday")
+            intervalo = None
+            if modo_intraday:
+                intervalo = st.selectbox("Intervalo:", options=list(INTERVALOS_INTRADAY), index=1)
+                st.caption(f"Janela fixa das últimas {JANELA_INTRADAY} barras por ativo.")
+
+            # Probabilidade por simulação (apenas diário)
+            monte_carlo = st.checkbox("🎲 Probabilidade por Monte Carlo", disabled=modo_intraday,
+                                      help="Simula caminhos de preço e mede quantas vezes o alvo vem antes do stop")
+            simulador = None
+            if monte_carlo and not modo_intraday:
+                metodo = st.radio("Caminhos:", options=['bootstrap', 'atr'], horizontal=True,
+                                  format_func=lambda m: 'Bootstrap histórico' if m == 'bootstrap' else 'Escala ATR')
+                horizonte = st.slider("Horizonte (pregões):", 5, 60, 20)
+                simulador = SimuladorMonteCarlo(caminhos=2000, horizonte=horizonte, metodo=metodo)
+
+            # Regras de score da categoria (validadas ao salvar)
+            regras_salvas = gerenciador_ativos.obter_regras(categoria_selecionada)
+            with st.expander(f"🧮 Regras personalizadas ({len(regras_salvas)})"):
+                texto_regras = st.text_area(
+                    "Uma regra por linha:",
+                    value="\n".join(regras_salvas),
+                    key=f"regras_texto_{categoria_selecionada}",
+                    placeholder="RSI < 30 and Close > EMA_200 -> +1.0 weight 0.2",
+                    help="Variáveis: " + ", ".join(VARIAVEIS_REGRAS)
+                )
+                if st.button("💾 Salvar regras"):
+                    try:
+                        total = gerenciador_ativos.salvar_regras(categoria_selecionada, texto_regras.splitlines())
+                        st.success(f"✅ {total} regras salvas para a categoria.")
+                        regras_salvas = gerenciador_ativos.obter_regras(categoria_selecionada)
+                    except ValueError as erro:
+                        st.error(f"❌ {erro}")
+                aplicar_regras = st.checkbox("Aplicar regras no score", value=True, disabled=not regras_salvas)
+            regras = ConjuntoRegras(regras_salvas, ignorar_invalidas=True) if regras_salvas and aplicar_regras else None
+            if regras is not None and regras.invalidas:
+                st.warning("⚠️ Regras ignoradas: " + "; ".join(regras.invalidas))
             
             # Botão principal
             st.markdown("---")
@@ -1382,6 +4383,10 @@ def main():
             # Resetar estado e executar nova análise
             st.session_state.screener_executed = False
             st.session_state.filtered_results = []
+            st.session_state.dias_decisao = {}
+            st.session_state.monitor_estados = {}
+            st.session_state.monitor_mudancas = {}
+            st.session_state.monitor_ultima = time.time()
             
             if not tickers_selecionados:
                 st.error("❌ Selecione pelo menos um ativo!")
@@ -1395,14 +4400,43 @@ def main():
             </div>
             """, unsafe_allow_html=True)
             
+            # Filtros baratos no snapshot de fundamentos antes de qualquer busca de preços
+            with st.spinner("📋 Aplicando filtros de fundamentos e liquidez..."):
+                tickers_analise, descartados = obter_snapshot_fundamentos().filtrar(
+                    tickers_selecionados, volume_min=min_volume * 1000, pe_max=max_pe
+                )
+            if len(descartados):
+                st.caption(f"📋 {len(descartados)} ativos descartados pelo snapshot diário "
+                           f"(volume médio ou P/E): {', '.join(descartados.index)}")
+            if not tickers_analise:
+                st.warning("⚠️ Nenhum ativo passou nos filtros de volume e P/E.")
+                return
+
             # Executar screener
+            st.session_state.screener_intervalo = intervalo
+            st.session_state.screener_simulador = simulador
+            st.session_state.screener_regras = regras
             with st.spinner("🔄 Processando análise com estratégias..."):
-                resultados = screener.executar_screener(tickers_selecionados)
+                resultados = screener.executar_screener(tickers_analise, intervalo, simulador, regras)
             
             if not resultados:
                 st.error("❌ Não foi possível analisar nenhum ativo.")
                 return
             
+            # Histórico persistente: todos os ativos analisados, antes dos filtros de exibição
+            obter_historico_execucoes().registrar(
+                resultados, categoria_selecionada,
+                {
+                    'pesos': screener.criterios_pesos,
+                    'intervalo': intervalo,
+                    'simulador': vars(simulador) if simulador else None,
+                    'regras': [r.texto for r in regras.regras] if regras else None,
+                    'min_volume': min_volume,
+                    'max_pe': max_pe
+                },
+                intervalo
+            )
+            
             # Aplicar filtros
             resultados_filtrados = []
             for r in resultados:
@@ -1426,6 +4460,10 @@ def main():
             # **CORREÇÃO: Salvar no session_state**
             st.session_state.filtered_results = resultados_filtrados
             st.session_state.screener_executed = True
+            # Histórico de score por barra (diário): calculado uma vez por execução, não a cada rerun
+            if not intervalo:
+                st.session_state.dias_decisao = calcular_dias_decisao(screener, resultados_filtrados)
+            st.session_state.motor_alertas.processar(resultados_filtrados)
             
             # Definir ticker padrão para análise
             if resultados_filtrados:
@@ -1440,6 +4478,54 @@ def main():
             if not resultados_filtrados:
                 st.warning("⚠️ Nenhum ativo passou nos filtros.")
                 return
+
+            # **MONITORAMENTO AO VIVO - APENAS A ÚLTIMA BARRA**
+            col_mon1, col_mon2 = st.columns(2)
+            with col_mon1:
+                monitorar = st.toggle("🔴 Monitoramento ao vivo", key="monitor_ativo")
+            with col_mon2:
+                intervalo_monitor = st.number_input(
+                    "Atualizar a cada (segundos):", min_value=15, max_value=3600,
+                    value=60, step=15, key="monitor_intervalo"
+                )
+
+            if monitorar:
+                def painel_monitoramento():
+                    # Tolerância de 1s para o timer do fragmento não pular um ciclo
+                    if time.time() - st.session_state.monitor_ultima >= intervalo_monitor - 1:
+                        st.session_state.monitor_ultima = time.time()
+                        novos, mudancas = atualizar_monitoramento(
+                            screener,
+                            st.session_state.filtered_results,
+                            st.session_state.monitor_estados,
+                            st.session_state.screener_intervalo,
+                            st.session_state.screener_simulador,
+                            st.session_state.screener_regras
+                        )
+                        st.session_state.filtered_results = novos
+                        st.session_state.monitor_mudancas = mudancas
+                        st.session_state.motor_alertas.processar(novos)
+                        st.rerun()
+
+                    ultima = datetime.fromtimestamp(st.session_state.monitor_ultima).strftime('%H:%M:%S')
+                    st.caption(f"⏱️ Última atualização: {ultima}")
+
+                st.fragment(painel_monitoramento, run_every=intervalo_monitor)()
+
+            motor_alertas = st.session_state.motor_alertas
+            if motor_alertas.feed:
+                with st.expander(f"🔔 Alertas recentes ({len(motor_alertas.feed)})"):
+                    for alerta in list(motor_alertas.feed)[:50]:
+                        st.markdown(f"`{alerta['data']}` {alerta['mensagem']}")
+                    if motor_alertas.suprimidos:
+                        st.caption(f"{motor_alertas.suprimidos} alertas suprimidos: {motor_alertas.duplicados} "
+                                   f"repetidos na janela de de-duplicação, {motor_alertas.limitados} pelo limite por minuto.")
+
+            mudancas = st.session_state.monitor_mudancas
+            if mudancas:
+                st.warning("🔔 Decisões alteradas na última atualização: " + ", ".join(
+                    f"**{ticker}** {antes} → {depois}" for ticker, (antes, depois) in mudancas.items()
+                ))
             
             # **DASHBOARD**
             st.markdown("### 📊 Dashboard Executivo")
@@ -1466,13 +4552,153 @@ def main():
                 prob_media = np.mean([r['estrategia'].get('probabilidade', 50) for r in resultados_filtrados])
                 st.metric("🎯 Prob. Média", f"{prob_media:.0f}%")
             
-            # **OPORTUNIDADES COM CARDS COMPLETOS - CORREÇÃO APLICADA**
+            # **TABELA COMPLETA - VIRTUALIZADA E ORDENÁVEL**
+            st.markdown("### 📋 Todos os Resultados")
+
+            tabela_resultados = criar_tabela_resultados(resultados_filtrados, mudancas, st.session_state.dias_decisao)
+            st.dataframe(
+                tabela_resultados,
+                use_container_width=True,
+                hide_index=True,
+                height=min(600, 38 + 35 * len(tabela_resultados)),
+                column_config=CONFIG_COLUNAS_RESULTADOS
+            )
+
+            # **TOP DIVERSIFICADO - SEM NOMES ALTAMENTE CORRELACIONADOS**
+            diversificar = st.checkbox("🧩 Diversificar Top-N por correlação", key="diversificar_top")
+            if diversificar:
+                col_div1, col_div2 = st.columns(2)
+                with col_div1:
+                    limite_correlacao = st.slider(
+                        "Correlação máxima:", 0.3, 0.95, 0.7, 0.05, key="diversificar_limite"
+                    )
+                with col_div2:
+                    quantidade_top = st.number_input(
+                        "Quantidade (N):", min_value=1, max_value=50, value=10, step=1, key="diversificar_n"
+                    )
+
+                tickers_ordenados = [r['ticker'] for r in resultados_filtrados]
+                painel = screener.montar_painel_fechamentos(tickers_ordenados)
+                if painel.shape[1] > 1:
+                    correlacao = calcular_matriz_correlacao(painel)
+                    selecionados, excluidos = selecionar_diversificados(
+                        tickers_ordenados, correlacao, limite_correlacao, int(quantidade_top)
+                    )
+
+                    tabela_diversificada = tabela_resultados.set_index('Ticker').loc[selecionados].reset_index()
+                    st.dataframe(
+                        tabela_diversificada,
+                        use_container_width=True,
+                        hide_index=True,
+                        column_config=CONFIG_COLUNAS_RESULTADOS
+                    )
+                    if excluidos:
+                        st.caption("Excluídos por correlação: " + ", ".join(
+                            f"{ticker} (ρ={rho:.2f} com {par})" for ticker, (par, rho) in excluidos.items()
+                        ))
+                else:
+                    st.info("ℹ️ São necessários pelo menos dois ativos com histórico para a correlação.")
+
+            # **OPORTUNIDADES COM CARDS COMPLETOS - PAGINADOS**
             st.markdown("### 🏆 Oportunidades com Estratégias Completas")
-            
+
+            col_pag1, col_pag2, col_pag3 = st.columns([1, 1, 2])
+
+            with col_pag1:
+                cards_por_pagina = st.selectbox(
+                    "Cards por página:", options=[5, 10, 20], index=1, key="cards_por_pagina"
+                )
+
+            total_paginas = max(1, math.ceil(len(resultados_filtrados) / cards_por_pagina))
+            # Valor inicial vem só do session_state (value= junto da key gera aviso a cada rerun)
+            if st.session_state.pagina_cards > total_paginas:
+                st.session_state.pagina_cards = 1
+
+            with col_pag2:
+                pagina = st.number_input(
+                    f"Página (de {total_paginas}):", min_value=1, max_value=total_paginas,
+                    step=1, key="pagina_cards"
+                )
+
+            inicio_pagina = (int(pagina) - 1) * cards_por_pagina
+            resultados_pagina = resultados_filtrados[inicio_pagina:inicio_pagina + cards_por_pagina]
+            tickers_pagina = {r['ticker'] for r in resultados_pagina}
+
+            opcoes_expandir = [r['ticker'] for r in resultados_filtrados if r['ticker'] not in tickers_pagina]
+            st.session_state.cards_expandidos = [
+                t for t in st.session_state.get('cards_expandidos', []) if t in opcoes_expandir
+            ]
+
+            with col_pag3:
+                expandidos = st.multiselect(
+                    "Expandir cards de outros ativos:",
+                    options=opcoes_expandir,
+                    key="cards_expandidos"
+                )
+
             # **CORREÇÃO: Renderizar cards com unsafe_allow_html=True**
-            for resultado in resultados_filtrados[:10]:  # Top 10
+            for resultado in resultados_pagina:
                 st.markdown(criar_card_oportunidade(resultado), unsafe_allow_html=True)
-            
+
+            for resultado in resultados_filtrados:
+                if resultado['ticker'] in expandidos:
+                    st.markdown(criar_card_oportunidade(resultado), unsafe_allow_html=True)
+
+            # **CARTEIRA - DIMENSIONAMENTO POR RISCO**
+            st.markdown("---")
+            st.markdown("### 💼 Carteira e Gestão de Risco")
+
+            col_cart1, col_cart2, col_cart3, col_cart4 = st.columns(4)
+            with col_cart1:
+                capital = st.number_input("Capital (R$):", min_value=0.0, value=100000.0, step=10000.0, key="carteira_capital")
+            with col_cart2:
+                risco_trade = st.number_input("Risco por trade (%):", min_value=0.1, max_value=10.0, value=2.0, step=0.25, key="carteira_risco")
+            with col_cart3:
+                heat_max = st.number_input("Risco total máx. (%):", min_value=0.5, max_value=50.0, value=10.0, step=0.5, key="carteira_heat")
+            with col_cart4:
+                max_posicao = st.number_input("Máx. por posição (%):", min_value=1.0, max_value=100.0, value=25.0, step=5.0, key="carteira_max_posicao")
+            fracionario = st.checkbox("B3: usar mercado fracionário (lote de 1 ação)", key="carteira_fracionario")
+
+            cambio = obter_cambio(screener, [r['ticker'] for r in resultados_filtrados])
+            tabela_carteira, resumo_carteira = dimensionar_posicoes(
+                resultados_filtrados, capital, risco_trade, heat_max, max_posicao, fracionario, cambio
+            )
+            if len(cambio) > 1:
+                st.caption("💱 Posições fora da B3 convertidas para R$: " + ", ".join(
+                    f"{moeda} = R$ {valor:.4f}" if pd.notna(valor) else f"{moeda} sem cotação (posições zeradas)"
+                    for moeda, valor in cambio.items() if moeda != 'BRL'
+                ))
+
+            if tabela_carteira.empty:
+                st.info("ℹ️ Nenhuma posição acionável cabe nos parâmetros de risco informados.")
+            else:
+                col_res1, col_res2, col_res3, col_res4 = st.columns(4)
+                with col_res1:
+                    st.metric("📦 Posições", resumo_carteira['posicoes'])
+                with col_res2:
+                    st.metric("💰 Alocado", f"R$ {resumo_carteira['alocado']:,.0f}")
+                with col_res3:
+                    st.metric("🛡️ Risco Total", f"R$ {resumo_carteira['risco_total']:,.0f}")
+                with col_res4:
+                    st.metric("🔥 Heat", f"{resumo_carteira['heat_pct']:.1f}%")
+
+                st.dataframe(
+                    tabela_carteira,
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={
+                        'Câmbio': st.column_config.NumberColumn(format="%.4f"),
+                        'Entrada': st.column_config.NumberColumn(help="Na moeda do ativo", format="%.2f"),
+                        'Stop Loss': st.column_config.NumberColumn(help="Na moeda do ativo", format="%.2f"),
+                        'Quantidade': st.column_config.NumberColumn(format="%g"),
+                        'Valor Posição R$': st.column_config.NumberColumn(format="%.2f"),
+                        'Peso %': st.column_config.NumberColumn(format="%.1f"),
+                        'Risco R$': st.column_config.NumberColumn(format="%.2f"),
+                        'Risco %': st.column_config.NumberColumn(format="%.2f"),
+                        'Volatilidade %': st.column_config.NumberColumn(format="%.2f")
+                    }
+                )
+
             # **ANÁLISE TÉCNICA DETALHADA - CORREÇÃO DO RESET**
             st.markdown("---")
             st.markdown("### 🔍 Análise Técnica Detalhada")
@@ -1497,83 +4723,85 @@ def main():
             # Gráfico técnico
             if ticker_detalhado:
                 with st.spinner(f"Carregando análise técnica de {ticker_detalhado}..."):
-                    df_grafico, _ = screener.obter_dados_acao(ticker_detalhado, "6mo")
+                    intervalo_grafico = st.session_state.screener_intervalo
+                    if intervalo_grafico:
+                        df_grafico = obter_armazem_intraday().atualizar(ticker_detalhado, intervalo_grafico)
+                    else:
+                        df_grafico, _ = screener.obter_dados_acao(ticker_detalhado, "6mo")
                     if df_grafico is not None and len(df_grafico) > 50:
-                        df_grafico = screener.calcular_indicadores(df_grafico)
-                        fig = criar_grafico_profissional(ticker_detalhado, df_grafico)
+                        # **Figura reaproveitada enquanto não houver barra nova**
+                        fig = obter_grafico_cache(
+                            ticker_detalhado, intervalo_grafico or "6mo",
+                            (df_grafico.index[-1], float(df_grafico['Close'].iloc[-1])),
+                            _screener=screener, _df=df_grafico
+                        )
                         st.plotly_chart(fig, use_container_width=True)
                     else:
                         st.error(f"❌ Não foi possível carregar dados para {ticker_detalhado}.")
+
+                # **Evolução do score no último ano (avaliado em todas as barras)**
+                resultado_detalhado = next(r for r in resultados_filtrados if r['ticker'] == ticker_detalhado)
+                historico_score = None if intervalo_grafico else obter_historico_score(screener, resultado_detalhado)
+                if historico_score is not None:
+                    dias = screener.dias_desde_mudanca(historico_score)
+                    st.markdown(
+                        f"**📈 Evolução do Score** — decisão atual no histórico: "
+                        f"{historico_score['decisao'].iloc[-1]}"
+                        + (f" há {dias} dias" if dias is not None else " em todo o período")
+                    )
+                    st.line_chart(historico_score['score'], height=220)
+                    st.caption("Critérios técnicos recalculados barra a barra; P/E, ROE, força relativa e "
+                               "regras personalizadas entram com o valor atual.")
             
             # **EXPORT**
             st.markdown("---")
             st.markdown("### 💾 Exportar Resultados")
-            
-            # Preparar dados
-            dados_export = []
-            for r in resultados_filtrados:
-                estrategia = r['estrategia']
-                dados_export.append({
-                    'Ticker': r['ticker'],
-                    'Nome': r['nome'],
-                    'Preço': r['preco'],
-                    'Score': r['score_total'],
-                    'Decisão': r['decisao'],
-                    'Setup': estrategia['setup'],
-                    'Entrada': estrategia.get('entrada'),
-                    'Stop Loss': estrategia.get('stop_loss'),
-                    'Alvo': estrategia.get('alvo_2'),
-                    'R/R': estrategia.get('risco_retorno', 0),
-                    'Probabilidade': estrategia.get('probabilidade', 50)
-                })
-            
+
+            # **Arquivos gerados sob demanda, somente no clique de download**
+            incluir_painel = st.checkbox(
+                "Incluir painel completo de indicadores (Parquet/Arrow)",
+                key="export_incluir_painel"
+            )
+            carimbo = datetime.now().strftime('%Y%m%d_%H%M')
+
             col_exp1, col_exp2, col_exp3 = st.columns(3)
             
             with col_exp1:
-                csv_completo = pd.DataFrame(dados_export).to_csv(index=False)
                 st.download_button(
                     label="📥 Download Completo (CSV)",
-                    data=csv_completo,
-                    file_name=f"screener_estrategias_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
+                    data=functools.partial(exportar_csv, resultados_filtrados),
+                    file_name=f"screener_estrategias_{carimbo}.csv",
                     mime="text/csv"
                 )
+
+                st.download_button(
+                    label="🗂️ Execução Completa (Parquet)",
+                    data=functools.partial(exportar_parquet, resultados_filtrados, screener, incluir_painel),
+                    file_name=f"screener_execucao_{carimbo}.parquet",
+                    mime="application/vnd.apache.parquet"
+                )
             
             with col_exp2:
-                forte_compra_data = [d for d in dados_export if d['Decisão'] == 'Forte Compra']
-                if forte_compra_data:
-                    csv_forte_compra = pd.DataFrame(forte_compra_data).to_csv(index=False)
+                if forte_compra:
                     st.download_button(
                         label="🚀 Apenas Forte Compra",
-                        data=csv_forte_compra,
-                        file_name=f"forte_compra_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
+                        data=functools.partial(exportar_csv, resultados_filtrados, 'Forte Compra'),
+                        file_name=f"forte_compra_{carimbo}.csv",
                         mime="text/csv"
                     )
+
+                st.download_button(
+                    label="🏹 Execução Completa (Arrow IPC)",
+                    data=functools.partial(exportar_arrow_ipc, resultados_filtrados, screener, incluir_painel),
+                    file_name=f"screener_execucao_{carimbo}.arrow",
+                    mime="application/vnd.apache.arrow.file"
+                )
             
             with col_exp3:
-                resumo = f"""
-SCREENER PRO BR v2.1.3 - RELATÓRIO CORRIGIDO
-Data: {datetime.now().strftime('%d/%m/%Y %H:%M')}
-
-CORREÇÕES IMPLEMENTADAS:
-✅ HTML renderizado corretamente
-✅ Sem reset da tela ao selecionar ativo
-✅ Tratamento robusto de valores NaN
-✅ Verificações matemáticas de segurança
-
-RESUMO:
-- Analisados: {len(resultados_filtrados)}
-- Forte Compra: {forte_compra}
-- R/R médio: 1:{rr_medio:.1f}
-- Probabilidade média: {prob_media:.0f}%
-
-TOP 5:
-{chr(10).join([f"{i+1}. {r['ticker']} - {r['decisao']} (R/R: 1:{r['estrategia'].get('risco_retorno', 0):.1f})" for i, r in enumerate(resultados_filtrados[:5])])}
-                """
-                
                 st.download_button(
                     label="📄 Relatório Corrigido",
-                    data=resumo,
-                    file_name=f"relatorio_corrigido_{datetime.now().strftime('%Y%m%d_%H%M')}.txt",
+                    data=functools.partial(gerar_relatorio_texto, resultados_filtrados),
+                    file_name=f"relatorio_corrigido_{carimbo}.txt",
                     mime="text/plain"
                 )
             
@@ -1582,7 +4810,9 @@ TOP 5:
             if st.button("🔄 Nova Análise", type="secondary"):
                 st.session_state.screener_executed = False
                 st.session_state.filtered_results = []
+                st.session_state.dias_decisao = {}
                 st.session_state.selected_ticker_analysis = None
+                st.session_state.monitor_mudancas = {}
                 st.rerun()
                 
         elif not st.session_state.screener_executed:
@@ -1613,6 +4843,130 @@ TOP 5:
                 </div>
                 """, unsafe_allow_html=True)
     
+        # **Histórico de execuções persistido**
+        with st.expander("🗂️ Histórico de Execuções"):
+            historico = obter_historico_execucoes()
+            col1, col2 = st.columns(2)
+            with col1:
+                ticker_historico = st.text_input("Ticker:", value=st.session_state.selected_ticker_analysis or "",
+                                                 key="historico_ticker").strip().upper()
+                if ticker_historico:
+                    situacao = historico.tempo_na_decisao(ticker_historico)
+                    if situacao is None:
+                        st.info(f"ℹ️ Nenhuma execução registrada para {ticker_historico}.")
+                    else:
+                        dias = (situacao['ultima'] - situacao['desde']).days
+                        st.metric(
+                            f"{ticker_historico} em {situacao['decisao']}",
+                            f"{dias} dias",
+                            help=f"Desde {situacao['desde'].tz_convert('America/Sao_Paulo'):%d/%m/%Y %H:%M}, "
+                                 f"{situacao['execucoes']} execuções consecutivas"
+                        )
+                        serie = historico.consultar(tickers=[ticker_historico], colunas=['instante', 'score'])
+                        st.line_chart(serie.set_index('instante')['score'], height=180)
+            with col2:
+                dias_mudancas = st.selectbox("Mudanças de decisão nos últimos:", [7, 30, 90],
+                                             format_func=lambda d: f"{d} dias", key="historico_dias")
+                inicio = (datetime.now() - timedelta(days=dias_mudancas)).date().isoformat()
+                mudancas = historico.mudancas_decisao(inicio)
+                if mudancas.empty:
+                    st.info("ℹ️ Nenhuma mudança de decisão no período.")
+                else:
+                    st.dataframe(
+                        mudancas[['instante', 'ticker', 'decisao_anterior', 'decisao', 'score']],
+                        hide_index=True,
+                        use_container_width=True,
+                        column_config={
+                            'instante': st.column_config.DatetimeColumn("Execução", format="DD/MM HH:mm"),
+                            'ticker': "Ticker",
+                            'decisao_anterior': "De",
+                            'decisao': "Para",
+                            'score': st.column_config.NumberColumn("Score", format="%.2f")
+                        }
+                    )
+    
+        # **Scanner histórico de setups na categoria**
+        with st.expander("🔎 Scanner de Setups Históricos"):
+            col1, col2 = st.columns([1, 3])
+            with col1:
+                periodo_scanner = st.selectbox("Período:", ["1y", "2y", "5y"], index=1,
+                                               format_func=lambda p: f"{p[:-1]} ano(s)", key="scanner_periodo")
+                if st.button("🔎 Escanear Categoria", key="scanner_executar", use_container_width=True):
+                    with st.spinner(f"Escaneando {len(tickers_categoria)} ativos..."):
+                        ocorrencias, estatisticas = screener.escanear_setups(tickers_categoria, periodo_scanner, regras)
+                    st.session_state.scanner_setups = {
+                        'categoria': info_categoria.get('nome', categoria_selecionada),
+                        'periodo': periodo_scanner,
+                        'ocorrencias': ocorrencias,
+                        'estatisticas': estatisticas
+                    }
+            
+            scanner = st.session_state.scanner_setups
+            with col2:
+                if scanner is None:
+                    st.info("ℹ️ Encontra cada vez que Pullback EMA21, Breakout ou Breakdown apareceu "
+                            "em todos os ativos da categoria.")
+                elif scanner['ocorrencias'].empty:
+                    st.info(f"ℹ️ Nenhum setup encontrado em {scanner['categoria']} ({scanner['periodo']}).")
+                else:
+                    st.markdown(f"**{scanner['categoria']}** · {scanner['periodo']} · "
+                                f"{len(scanner['ocorrencias'])} ocorrências")
+                    st.caption("Critérios técnicos barra a barra; P/E, ROE, força relativa e regras com o valor "
+                               "atual em todas as barras (viés de antecipação).")
+                    st.dataframe(
+                        scanner['estatisticas'],
+                        hide_index=True,
+                        use_container_width=True,
+                        column_config={
+                            'setup': "Setup",
+                            'ocorrencias': "Ocorrências",
+                            'por_ticker_ano': st.column_config.NumberColumn("Por Ativo/Ano", format="%.1f"),
+                            'tickers': "Ativos",
+                            'barras_media': st.column_config.NumberColumn("Duração Média (barras)", format="%.1f"),
+                            'ultima': st.column_config.DateColumn("Última", format="DD/MM/YYYY")
+                        }
+                    )
+            
+            if scanner is not None and not scanner['ocorrencias'].empty:
+                ocorrencias = scanner['ocorrencias']
+                st.bar_chart(
+                    ocorrencias.groupby([ocorrencias['data'].dt.year.rename('ano'), 'setup']).size().unstack(fill_value=0),
+                    height=200
+                )
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    filtro_setup = st.multiselect("Setups:", list(SETUPS_ESTRATEGIA), key="scanner_filtro_setup")
+                with col2:
+                    filtro_ticker = st.multiselect("Ativos:", sorted(ocorrencias['ticker'].unique()),
+                                                   key="scanner_filtro_ticker")
+                if filtro_setup:
+                    ocorrencias = ocorrencias[ocorrencias['setup'].isin(filtro_setup)]
+                if filtro_ticker:
+                    ocorrencias = ocorrencias[ocorrencias['ticker'].isin(filtro_ticker)]
+                
+                st.dataframe(
+                    ocorrencias.sort_values('data', ascending=False)[
+                        ['ticker', 'data', 'setup', 'decisao', 'preco', 'entrada', 'stop_loss',
+                         'alvo_1', 'alvo_2', 'risco_retorno', 'barras']
+                    ],
+                    hide_index=True,
+                    use_container_width=True,
+                    column_config={
+                        'ticker': "Ticker",
+                        'data': st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
+                        'setup': "Setup",
+                        'decisao': "Decisão",
+                        'preco': st.column_config.NumberColumn("Preço", format="%.2f"),
+                        'entrada': st.column_config.NumberColumn("Entrada", format="%.2f"),
+                        'stop_loss': st.column_config.NumberColumn("Stop", format="%.2f"),
+                        'alvo_1': st.column_config.NumberColumn("Alvo 1", format="%.2f"),
+                        'alvo_2': st.column_config.NumberColumn("Alvo 2", format="%.2f"),
+                        'risco_retorno': st.column_config.NumberColumn("R:R", format="%.1f"),
+                        'barras': st.column_config.NumberColumn("Duração", help="Barras consecutivas no setup")
+                    }
+                )
+    
     elif selected == "📊 Gerenciar Ativos":
         # **GERENCIAMENTO DE ATIVOS** (mantém código original)
         
@@ -1622,9 +4976,12 @@ TOP 5:
         
         with tab1:
             categorias = gerenciador_ativos.obter_categorias()
+            if 'categoria_criada' in st.session_state:
+                st.session_state.categoria_edit = st.session_state.pop('categoria_criada')
             categoria_edit = st.selectbox(
                 "Selecione a categoria:",
-                options=categorias
+                options=categorias,
+                key="categoria_edit"
             )
             
             if categoria_edit:
@@ -1664,7 +5021,54 @@ TOP 5:
                             if gerenciador_ativos.remover_ticker(categoria_edit, ticker_remover):
                                 st.success(f"✅ {ticker_remover} removido!")
                                 st.rerun()
-                
+
+                # **Importação em lote: validação paralela e gravação única**
+                if 'resumo_importacao' in st.session_state:
+                    st.success(st.session_state.pop('resumo_importacao'))
+
+                with st.expander("📥 Importação em Lote"):
+                    texto_lote = st.text_area(
+                        "Cole os tickers (separados por vírgula, espaço ou linha):",
+                        key="lote_texto",
+                        placeholder="PETR4.SA, VALE3.SA\nITUB4.SA"
+                    )
+                    arquivo_lote = st.file_uploader(
+                        "Ou envie um CSV (coluna 'ticker' ou primeira coluna):",
+                        type=["csv", "txt"],
+                        key="lote_arquivo"
+                    )
+
+                    validar_lote = st.checkbox("Validar tickers no Yahoo Finance", value=True, key="lote_validar")
+
+                    if st.button("Importar", key="btn_importar_lote"):
+                        tickers_lote = extrair_tickers(texto_lote, arquivo_lote)
+
+                        if not tickers_lote:
+                            st.warning("⚠️ Nenhum ticker encontrado.")
+                        else:
+                            existentes = set(tickers_atuais)
+                            candidatos = [t for t in tickers_lote if t not in existentes]
+                            invalidos = []
+
+                            if validar_lote and candidatos:
+                                barra_validacao = st.progress(0)
+                                candidatos, invalidos = validar_tickers(
+                                    candidatos,
+                                    ao_progredir=lambda feitos, total: barra_validacao.progress(feitos / total)
+                                )
+                                barra_validacao.empty()
+
+                            adicionados = gerenciador_ativos.adicionar_tickers(categoria_edit, candidatos)
+
+                            resumo = f"✅ {len(adicionados)} tickers importados em '{categoria_edit}'."
+                            if len(tickers_lote) > len(adicionados) + len(invalidos):
+                                resumo += f" {len(tickers_lote) - len(adicionados) - len(invalidos)} já existentes."
+                            if invalidos:
+                                resumo += f" {len(invalidos)} inválidos: {', '.join(invalidos[:20])}"
+                                resumo += "..." if len(invalidos) > 20 else ""
+                            st.session_state.resumo_importacao = resumo
+                            st.rerun()
+
                 # Lista atual
                 if tickers_atuais:
                     st.markdown("**📋 Tickers Atuais:**")
@@ -1672,6 +5076,28 @@ TOP 5:
                     for i, ticker in enumerate(tickers_atuais):
                         with cols[i % 4]:
                             st.info(f"**{ticker}**")
+
+            # **Nova categoria - seção própria, fora do painel de importação**
+            st.markdown("---")
+            st.markdown("**🆕 Nova Categoria:**")
+            col_nc1, col_nc2 = st.columns(2)
+            with col_nc1:
+                id_nova_categoria = st.text_input("Identificador:", placeholder="ex: ibovespa", key="nova_categoria_id")
+            with col_nc2:
+                nome_nova_categoria = st.text_input("Nome:", placeholder="ex: 📈 Ibovespa", key="nova_categoria_nome")
+            descricao_nova_categoria = st.text_input("Descrição:", key="nova_categoria_descricao")
+
+            if st.button("Criar Categoria", key="btn_criar_categoria"):
+                destino = id_nova_categoria.strip()
+                if not destino:
+                    st.warning("⚠️ Informe o identificador da nova categoria.")
+                elif not gerenciador_ativos.criar_categoria(destino, nome_nova_categoria, descricao_nova_categoria):
+                    st.error(f"❌ Não foi possível criar '{destino}': a categoria já existe.")
+                else:
+                    # Seleciona a categoria criada para receber a importação em lote
+                    st.session_state.categoria_criada = destino
+                    st.session_state.resumo_importacao = f"✅ Categoria '{destino}' criada. Importe os tickers abaixo."
+                    st.rerun()
         
         with tab2:
             categorias = gerenciador_ativos.obter_categorias()
@@ -1723,22 +5149,34 @@ TOP 5:
             """)
         
         with tab2:
-            st.markdown("""
+            pesos = screener.criterios_pesos
+            st.markdown(f"""
             ## 📊 Indicadores Utilizados
             
-            ### **EMAs (25% do peso)**
+            ### **EMAs ({pesos['tendencia_ema']:.0%} do peso)**
             - EMA 9, 21, 50, 200
             - Alinhamento = tendência
             
-            ### **RSI (20% do peso)**
+            ### **RSI ({pesos['rsi']:.0%} do peso)**
             - < 30: Oversold (compra)
             - > 70: Overbought (venda)
             - Base para probabilidade
             
-            ### **MACD (15% do peso)**
+            ### **MACD ({pesos['macd']:.0%} do peso)**
             - Confirmação de momentum
             - Divergências importantes
             
+            ### **P/E e ROE ({pesos['pe_ratio']:.0%} + {pesos['roe']:.0%} do peso)**
+            - P/E entre 8 e 18 favorável, acima de 30 desfavorável
+            - ROE de 15% ou mais favorável, abaixo de 8% desfavorável
+            
+            ### **Liquidez ({pesos['liquidez']:.0%} do peso)**
+            - Volume médio de 20 pregões
+            
+            ### **Força Relativa ({pesos['forca_relativa']:.0%} do peso)**
+            - Retorno de 3 meses vs. benchmark (^BVSP, SPY, BTC-USD)
+            - Percentil dentro do universo analisado (futuros ficam sem dados)
+            
             ### **ATR**
             - Base para stops e alvos
             - Normaliza volatilidade
@@ -1758,7 +5196,8 @@ TOP 5:
             R: NÃO! Use como ferramenta de apoio, sempre faça sua análise.
             
             **P: Como calcular tamanho da posição?**
-            R: (Capital × 2%) ÷ (Entrada - Stop) = Quantidade
+            R: (Capital × 2%) ÷ (Entrada - Stop) = Quantidade. A seção "Carteira e Gestão de Risco"
+            faz esse cálculo para todos os ativos, respeitando lotes e o risco total máximo.
             """)
     
     # Footer
@@ -0,0 +1,16 @@
+import pytest
+
+from app import _respostas_api
+
+
+class _ScreenerSemBusca:
+    def obter_dados_acao(self, ticker, periodo="1y"):
+        raise AssertionError("período inválido não deve chegar ao cache de preços")
+
+
+@pytest.mark.parametrize("periodo", ["10y", "max", "1d", "", "1y;"])
+def test_indicadores_recusa_periodo_invalido(periodo):
+    status, corpo = _respostas_api(None, None, _ScreenerSemBusca(), "/api/indicadores/PETR4.SA",
+                                   {'periodo': [periodo]})
+    assert status == 400
+    assert "periodo" in corpo['erro']
@@ -0,0 +1,28 @@
+import pytest
+
+from app import dimensionar_posicoes
+
+
+def _resultado(ticker, entrada, stop):
+    return {
+        'ticker': ticker,
+        'decisao': "Compra",
+        'estrategia': {'tipo': 'COMPRA', 'entrada': entrada, 'stop_loss': stop},
+        'gestao_risco': {'volatilidade_pct': 2.0}
+    }
+
+
+def test_exposicao_total_nao_passa_do_capital():
+    capital = 100_000
+    resultados = [_resultado(f"ATIVO{i}.SA", 10.0 + i, 9.9 + i) for i in range(5)]
+    tabela, resumo = dimensionar_posicoes(resultados, capital, fracionario_b3=True)
+
+    assert len(tabela) == 5
+    assert (tabela['Quantidade'] * tabela['Entrada']).sum() <= capital
+    assert resumo['alocado'] <= capital
+
+
+def test_peso_maximo_por_posicao_respeitado():
+    tabela, _ = dimensionar_posicoes([_resultado("ATIVO0.SA", 10.0, 9.9)], 100_000, fracionario_b3=True)
+
+    assert tabela['Peso %'].iloc[0] == pytest.approx(25.0)
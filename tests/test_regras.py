@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from app import ConjuntoRegras, GerenciadorAtivos, RegraScore
+
+
+@pytest.mark.parametrize("texto", [
+    "not RSI -> +1.0 weight 0.2",
+    "RSI and Close > 5 -> +1.0 weight 0.2",
+    "RSI < 30 or PE -> -0.5 peso 0.1",
+    "(RSI < 30) + 1 > 0 -> +1.0 weight 0.2",
+    "-(RSI < 30) -> +1.0 weight 0.2",
+    "RSI -> +1.0 weight 0.2",
+])
+def test_operandos_nao_booleanos_sao_recusados(texto):
+    with pytest.raises(ValueError):
+        RegraScore(texto)
+
+
+@pytest.mark.parametrize("texto", [
+    "RSI < 30 and Close > EMA_200 -> +1.0 weight 0.2",
+    "not RSI > 70 -> +0.5 weight 0.1",
+    "30 < RSI < 70 or (MACD > MACD_Signal and not PE > 30) -> -0.5 peso 0.3",
+    "Close / ATR > 10 -> +1.0 weight 0.2",
+])
+def test_regras_validas_compilam(texto):
+    assert RegraScore(texto).variaveis
+
+
+def test_regra_que_falha_na_avaliacao_e_recusada(monkeypatch):
+    def quebrar(self, colunas, n):
+        raise TypeError("falha simulada")
+
+    monkeypatch.setattr(RegraScore, "avaliar", quebrar)
+    with pytest.raises(ValueError, match="falha ao ser avaliada"):
+        RegraScore("RSI < 30 -> +1.0 weight 0.2")
+
+
+def test_avaliacao_vetorizada():
+    regras = ConjuntoRegras(["RSI < 30 and not Close > EMA_50 -> +1.0 weight 0.2"])
+    linhas = [
+        {'RSI': 25.0, 'Close': 10.0, 'EMA_50': 12.0},
+        {'RSI': 25.0, 'Close': 13.0, 'EMA_50': 12.0},
+        {'RSI': np.nan, 'Close': 10.0, 'EMA_50': 12.0},
+    ]
+    ativas = [c['regra_1']['ativa'] for c in regras.avaliar(linhas)]
+    assert ativas == [True, False, False]
+
+
+
+@pytest.mark.parametrize("texto, com_pe", [
+    ("not PE > 30 -> +1.0 weight 0.2", True),
+    ("not (PE > 30 or RSI > 70) -> +1.0 weight 0.2", True),
+    ("not not PE > 30 -> +1.0 weight 0.2", False),
+])
+def test_negacao_nao_satisfaz_operando_nan(texto, com_pe):
+    regras = ConjuntoRegras([texto])
+    linhas = [
+        {'PE': 10.0, 'RSI': 50.0},
+        {'PE': None, 'RSI': 50.0},
+        {'PE': np.nan, 'RSI': 50.0},
+    ]
+    ativas = [c['regra_1']['ativa'] for c in regras.avaliar(linhas)]
+    assert ativas == [com_pe, False, False]
+
+def test_carregamento_tolerante_pula_regras_invalidas():
+    regras = ConjuntoRegras(["RSI < 30 -> +1.0 weight 0.2", "not RSI -> +1.0 weight 0.2"], ignorar_invalidas=True)
+    assert len(regras.regras) == 1
+    assert regras.invalidas and regras.invalidas[0].startswith("Regra 2")
+
+
+def test_salvar_regras_recusa_regra_invalida(tmp_path):
+    gerenciador = GerenciadorAtivos(arquivo_db=str(tmp_path / "ativos.sqlite3"),
+                                    arquivo_json=str(tmp_path / "inexistente.json"))
+    categoria = "teste"
+    assert gerenciador.criar_categoria(categoria, "Teste")
+    with pytest.raises(ValueError, match="Regra 2"):
+        gerenciador.salvar_regras(categoria, ["RSI < 30 -> +1.0 weight 0.2", "RSI and Close > 5 -> +1.0 weight 0.2"])
+    assert gerenciador.obter_regras(categoria) == []